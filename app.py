@@ -1,42 +1,153 @@
+import argparse
+import itertools
+import queue
 import cv2
 import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk
-import base64
 import requests
-import numpy as np
 import subprocess
+import sys
 import time
 import threading
+from backend_client import get_client, get_stream_client, close_clients
+from frame_pipeline import AdaptiveController, FramePipeline, open_source, put_latest
+import metrics
+from mosaic import mosaic_faces
+from session_store import UNKNOWN_SESSION_ERROR
+import overlay
+from shared_frames import SharedFrameRing
+
+# Send frames as raw JPEG bodies instead of base64 inside JSON (set to False for the JSON contract)
+USE_BINARY_TRANSPORT = True
+
+# The backends run on this machine: pass raw frames through a shared memory ring buffer and send only
+# the slot reference (no JPEG encode/decode, no compression loss); frames that don't fit use JPEG
+USE_SHARED_MEMORY = True
+
+# Ask the backends for the results only and draw them on the frame the client already holds
+# (no JPEG encode/decode of a processed frame, much smaller responses)
+USE_CLIENT_OVERLAYS = True
+
+# Face mosaic preview: outline the faces on the unmasked video instead of masking them (not for privacy)
+MOSAIC_PREVIEW = False
+
+# Display frame rate the adaptive controller aims for: it lowers the inference resolution and
+# skips frames (showing them with the last results) when the backend round trip is too slow
+TARGET_FPS = 15
+
+# Tracking algorithm of new tracking sessions: "csrt", "kcf", "mosse", "mil"... or "adaptive"
+# (CSRT, falling back to cheaper trackers while the backend's update time is over budget)
+TRACKER = "adaptive"
+
+# Serve every feature from one backend process (inference_server.py) instead of one process per feature
+USE_INFERENCE_SERVER = True
+INFERENCE_SERVER = ("inference_server.py", "http://127.0.0.1:5005")
+
+# Push frames to the inference server over one persistent connection (several frames in flight,
+# no per-frame HTTP request) instead of one HTTP POST per frame
+USE_STREAMING = True
+STREAM_ADDRESS = ("127.0.0.1", 5006)
+
+# Backend of each feature: (standalone script, standalone URL, route prefix on the inference server)
+BACKENDS = {
+    "face_detection": ("face_detection.py", "http://127.0.0.1:5000", ""),
+    "face_mosaic": ("face_mosaic.py", "http://127.0.0.1:5001", ""),
+    "detect_features": ("detect_features.py", "http://127.0.0.1:5002", ""),
+    "single_object_tracking": ("single_object_tracking.py", "http://127.0.0.1:5003", "/single"),
+    "multi_object_tracking": ("multi_object_tracking.py", "http://127.0.0.1:5004", "/multi"),
+}
+
+# Models each feature waits for before its window opens (the other features don't use FaceNet,
+# so they start as soon as the backend is up, even while FaceNet is loading or failed to load)
+FEATURE_MODELS = {
+    "face_detection": ["facenet"],
+}
+
+# Backend processes started by this application (script -> process), reused on every re-click
+backend_processes = {}
+
+# Video sources opened by each feature: camera indices, video files or stream URLs
+# (e.g. python app.py --sources 0 recording.mp4 http://127.0.0.1:8090/stream.mjpg)
+parser = argparse.ArgumentParser(description="Image Recognition Application")
+parser.add_argument("--sources", nargs="+", default=["0"])
+parser.add_argument("--no-metrics", action="store_true", help="disable the latency metrics and overlays")
+args, _ = parser.parse_known_args()
+DEFAULT_SOURCES = args.sources
+
+# Per-stage latency metrics (switched off here also switches them off in the backends started below)
+if args.no_metrics:
+    metrics.configure(False)
+
+# Keys identifying each stream (window) in the backend's fair scheduler
+stream_ids = itertools.count()
+
+# Shared memory ring of this application (unlinked on exit)
+frame_ring = SharedFrameRing() if USE_SHARED_MEMORY else None
 
 # Define functions to activate the Flask server(customized for each function)
-def start_flask_server(script_name, server_name, wait_time=3):
-    def run_backend():
-        subprocess.Popen(["python", script_name])
-
-    backend_thread = threading.Thread(target=run_backend)
-    backend_thread.start()   
+def start_flask_server(script_name, server_name, wait_time=3, models=()):
+    process = backend_processes.get(script_name)
+    if process is None or process.poll() is not None: # Only start it if it isn't already running
+        backend_processes[script_name] = subprocess.Popen([sys.executable, script_name])
 
     # Try to connect to a server until the server starts successfully
+    client = get_client(server_name, binary=USE_BINARY_TRANSPORT, ring=frame_ring)
     server_started = False
-    for _ in range(wait_time): # Wait for the specified time to check every second
+    start = time.monotonic()
+    while time.monotonic() - start < wait_time: # Wait for the specified time to check every 0.5 second
         try:
-            response = requests.get(server_name)
+            # /ready answers 503 (with the state of each model) until the models are loaded and warmed up
+            response = client.get("/ready?models=" + ",".join(models))
             if response.status_code == 200:
                 print("Server started successfully")
                 server_started = True
                 break        
+            states = response.json().get("models", {})
+            failed = [f"{name}: {model['error']}" for name, model in states.items() if model["state"] == "failed"]
+            if failed:
+                show_status(f"Failed to load {'; '.join(failed)}")
+                return client
+            loading = [name for name, model in states.items() if model["state"] == "loading"]
+            show_status(f"Loading models: {', '.join(loading)} ({time.monotonic() - start:.0f} s)")
         except requests.ConnectionError:
-            print("Waiting for server to start...")
-            time.sleep(1)
-
-    if not server_started:
-        print(f"Failed to start the server after {wait_time} seconds")
+            show_status(f"Waiting for server to start... ({time.monotonic() - start:.0f} s)")
+
+        # Keep the window responsive while waiting
+        wait_until = time.monotonic() + 0.5
+        while time.monotonic() < wait_until:
+            root.update()
+            time.sleep(0.05)
+
+    if server_started:
+        show_status("Server ready")
+    else:
+        show_status(f"Failed to start the server after {wait_time} seconds")
+    return client
+
+# Helper function to start (or reuse) the backend of a feature and get its client
+def start_backend(feature, wait_time=60):
+    script_name, server_name, prefix = BACKENDS[feature]
+    if USE_INFERENCE_SERVER:
+        script_name, server_name = INFERENCE_SERVER
+    else:
+        prefix = ""
+    start_flask_server(script_name, server_name, wait_time, FEATURE_MODELS.get(feature, ()))
+    if USE_INFERENCE_SERVER and USE_STREAMING:
+        return get_stream_client(*STREAM_ADDRESS, prefix=prefix, ring=frame_ring)
+    return get_client(server_name + prefix, binary=USE_BINARY_TRANSPORT, ring=frame_ring)
+
+# Helper function to stop the backend processes started by this application
+def stop_backends():
+    for process in backend_processes.values():
+        if process.poll() is None:
+            process.terminate()
+    backend_processes.clear()
 
 # Initialize the main application window
 root = tk.Tk()
 root.title("Image Recognition Application")
-root.geometry("640x640")
+root.geometry("640x700")
 root.configure(bg="#d0d0d0") # light gray background 
 
 # Create a frame to center content vertically
@@ -83,19 +194,133 @@ def create_button(text, command, bg_color):
 
 # """Define the operation of each function"""
 
+# Display stage: show the newest processed frame of a pipeline in a Tkinter label
+# The window title also shows how many processed frames per second this stream gets, and an overlay
+# under the video shows the recent latency of each client stage (shared by all windows: the stage
+# histograms are process-wide; the backend's /metrics has the frame rate of each route)
+def show_pipeline(window, lmain, pipeline, on_result=None):
+    title = window.title()
+    last_title_update = 0
+    stats_text = None
+    if metrics.enabled:
+        stats_text = tk.Label(window, font=("Courier", 9), justify="left", anchor="w", wraplength=640)
+        stats_text.pack(fill="x")
+
+    def show_frame():
+        nonlocal last_title_update
+        if not window.winfo_exists():
+            return
+        output = pipeline.latest() # Only pull the latest ready frame, stale ones are dropped
+        if output is not None:
+            frame, results = output
+            if on_result is not None and results is not None:
+                on_result(results)
+
+            # Convert frame to image and display in Tkinter window
+            with metrics.timer("render"):
+                img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                imgtk = ImageTk.PhotoImage(image=img)
+                lmain.imgtk = imgtk
+                lmain.configure(image=imgtk)
+        if time.monotonic() - last_title_update > 1:
+            window.title(f"{title} ({pipeline.fps:.1f} fps)")
+            last_title_update = time.monotonic()
+            if stats_text is not None:
+                stages = " | ".join(f"{stage} {ms:.1f} ms" for stage, ms in metrics.recent_ms().items())
+                stats_text.config(text=f"{pipeline.fps:.1f} fps | all windows: {stages}")
+        if pipeline.running:
+            lmain.after(10, show_frame)
+
+    show_frame() # Start displaying the video feed
+
+    window.protocol("WM_DELETE_WINDOW", lambda: (pipeline.stop(), window.destroy()))
+
+# Helper function to add the "results only" request to the metadata when the client draws the overlays
+def response_meta(meta=None):
+    meta = dict(meta or {})
+    if USE_CLIENT_OVERLAYS:
+        meta["response"] = "annotations"
+    return meta
+
+# Backend session of a window, shared by the window's pipeline workers
+# Only one worker at a time sends the "initialize" request (otherwise each worker's first frame would
+# create its own session), and the session is only dropped when the backend no longer knows it
+class WindowSession:
+    def __init__(self):
+        self.id = None
+        self.initializing = False
+        self.lock = threading.Lock()
+
+    # Metadata of the next request: the session id, {"mode": "initialize"} for the one worker that
+    # creates the session, or None while another worker is creating it
+    def meta(self):
+        with self.lock:
+            if self.id is not None:
+                return {"session_id": self.id}
+            if self.initializing:
+                return None
+            self.initializing = True
+            return {"mode": "initialize"}
+
+    # Update the session from the results of a request sent with meta (None: no answer)
+    def update(self, meta, data):
+        with self.lock:
+            if meta.get("mode") == "initialize":
+                self.initializing = False
+            if data is None:
+                return
+            if "session_id" in data:
+                self.id = data["session_id"]
+            elif data.get("error") == UNKNOWN_SESSION_ERROR and meta.get("session_id") == self.id:
+                self.id = None # Expired or evicted: the next frame starts a new session
+
+# Helper function to send a frame to the backend, returning None when the request failed
+# or the backend was busy (the frame is simply dropped, the next one gets through)
+def request_backend(client, route, frame, meta=None, stream=None):
+    if stream is not None:
+        meta = dict(meta or {}, stream=stream) # Lets the backend reuse results while the scene is static
+    try:
+        response = client.post_frame(route, frame, meta, stream=stream)
+        if response[0].get("busy"):
+            return None
+        return response
+    except requests.exceptions.JSONDecodeError as e:
+        print(f"JSON decode error: {e}")
+    except requests.exceptions.RequestException as e:
+        print(f"Request failed: {e}")
+    except OSError as e: # Stream connection lost or no result in time
+        print(f"Stream request failed: {e}")
+    return None
+
+# Helper function to send a frame at the controller's inference resolution, measuring the round trip
+# Returns (results with boxes in display frame coordinates, processed frame at display size) or None
+def request_adaptive(controller, client, route, frame, meta=None, stream=None):
+    small, scale = controller.resize(frame)
+    start = time.perf_counter()
+    response = request_backend(client, route, small, meta, stream)
+    if response is None:
+        controller.overloaded()
+        return None
+    controller.record(time.perf_counter() - start)
+    data, processed_frame = response
+    if processed_frame is not None and scale != 1.0:
+        processed_frame = cv2.resize(processed_frame, (frame.shape[1], frame.shape[0]))
+    return overlay.scale_results(data, 1 / scale), processed_frame
+
 # Function1: face detection
-def face_detection():
+def face_detection(source="0"):
     # Activate the backend file
-    start_flask_server("face_detection.py", "http://127.0.0.1:5000", wait_time=5)
+    client = start_backend("face_detection")
 
-    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
+    cap, pace_fps = open_source(source)
     if not cap.isOpened():
-        print("Cannot open camera")
+        print(f"Cannot open video source: {source}")
         return
+    stream = next(stream_ids)
 
     # Create a new window to display the video feed
     detection_window = tk.Toplevel(root)
-    detection_window.title("Face Detection")
+    detection_window.title(f"Face Detection - {source}")
     lmain = tk.Label(detection_window)
     lmain.pack()
 
@@ -103,400 +328,330 @@ def face_detection():
     result_label = tk.Label(detection_window, text="Matching Result: ", font=("Helvetica", 14))
     result_label.pack()
 
-    # Initialize the frame counter & reference embedding
-    frame_counter = 0  
-    reference_embedding = None
-
-    def show_frame():
-        nonlocal frame_counter
-        ret, frame = cap.read()
-        if not ret:
-            print("Cannot receive frame")
-            return
-        
-        # Reduce size to speed up
-        frame = cv2.resize(frame, (640, 360)) 
-
-        # Send the frame to the server for processing every 10 frames
-        if frame_counter % 10 == 0:
-            # Encode the frame to send to the server
-            _, buffer = cv2.imencode(".jpg", frame) 
-            frame_str = base64.b64encode(buffer).decode("utf-8")
-
-            try:
-                # Send the frame to the backend for face detection and comparison
-                data_to_send = {"frame": frame_str}
-                nonlocal reference_embedding
-                if reference_embedding:
-                    data_to_send["reference_embedding"] = reference_embedding
-
-                response = requests.post("http://127.0.0.1:5000/detect_face", json=data_to_send)
-                data = response.json()
-
-                # Check if a reference face was set or if comparison results were returned
-                if "reference_embedding" in data:
-                    reference_embedding = data["reference_embedding"]
-                    result_label.config(text="Reference face set.")
-                else:
-                    result_label.config(text=f"{data['message']} (Distance: {data['distance']:.2f})")      
-
-            except requests.exceptions.JSONDecodeError as e:
-                print(f"JSON decode error: {e}")
-                print(f"Response content: {response.content}")
-                return
-            except requests.exceptions.RequestException as e:
-                print(f"Request failed: {e}")
-                return
-
-        # Convert frame to image and display in Tkinter window
-        img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        imgtk = ImageTk.PhotoImage(image=img)
-        lmain.imgtk = imgtk
-        lmain.configure(image=imgtk)
-        lmain.after(10, show_frame)
-
-    show_frame() # Start displaying the video feed
+    # Initialize the session (the reference face is kept by the backend)
+    session = WindowSession()
+
+    # Sends a frame as often as the matching latency allows (skipped frames are shown right away)
+    controller = AdaptiveController(target_fps=TARGET_FPS, workers=2)
+    last_results = None # Face boxes drawn again on the frames that are not sent
+
+    def process(frame):
+        nonlocal last_results
+        meta = session.meta() if controller.should_send() else None
+        if meta is None: # Skipped, or the other worker is setting the reference face
+            return (overlay.draw_faces(frame, last_results) if last_results else frame), None
+        response = request_adaptive(controller, client, "/detect_face", frame, meta, stream)
+        session.update(meta, response[0] if response is not None else None)
+        if response is None:
+            return frame, None
+        data = response[0]
+        if "faces" in data: # Green: matches the reference face, red: doesn't
+            last_results = data
+            frame = overlay.draw_faces(frame, data)
+        return frame, data
+
+    # Runs on the Tk thread: update the matching result
+    def show_result(data):
+        # Check if a reference face was set or if comparison results were returned
+        if "error" in data:
+            result_label.config(text=f"Error: {data['error']}")
+        elif "session_id" in data:
+            result_label.config(text="Reference face set.")
+        elif "distance" in data:
+            result_label.config(text=f"{data['message']} (Distance: {data['distance']:.2f}, Faces: {len(data['faces'])})")
+        else:
+            result_label.config(text=data["message"])
 
-    detection_window.protocol("WM_DELETE_WINDOW", lambda: (cap.release(), detection_window.destroy()))
+    # Two workers so the displayed video keeps flowing while a face is being matched
+    pipeline = FramePipeline(cap, process, workers=2, pace_fps=pace_fps).start()
+    show_pipeline(detection_window, lmain, pipeline, show_result)
 
 # Function 2: face mosaic   
-def face_mosaic():
+def face_mosaic(source="0"):
     # Activate the backend file
-    start_flask_server("face_mosaic.py", "http://127.0.0.1:5001")
+    client = start_backend("face_mosaic")
     
-    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
+    cap, pace_fps = open_source(source)
     if not cap.isOpened():
-        print("Cannot open camera")
+        print(f"Cannot open video source: {source}")
         return
+    stream = next(stream_ids)
 
     # Create a new window to display the video feed
     mosaic_window = tk.Toplevel(root)
-    mosaic_window.title("Face Mosaic")
+    mosaic_window.title(f"Face Mosaic - {source}")
     lmain = tk.Label(mosaic_window)
     lmain.pack()
 
-    def show_frame():
-        ret, frame = cap.read()
-        if not ret:
-            print("Cannot receive frame")
-            return
-
-        # Reduce size to speed up
-        frame = cv2.resize(frame, (640, 360)) 
-        
-        # Encode the frame to send to the server
-        _, buffer = cv2.imencode(".jpg", frame) 
-        frame_str = base64.b64encode(buffer).decode("utf-8")
-
-        try:
-            # Send the frame to the backend for mosaic processing
-            response = requests.post("http://127.0.0.1:5001/apply_mosaic", json={"frame": frame_str})
-            data = response.json()
-
-            # Decode the processed frame
-            frame_str = base64.b64decode(data["frame"])
-            nparr = np.frombuffer(frame_str, np.uint8)
-            processed_frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)       
-
-        except requests.exceptions.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-            print(f"Response content: {response.content}")
-            return
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
-            return
-                
-        # Convert frame to image and display in Tkinter window
-        img = Image.fromarray(cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB))
-        imgtk = ImageTk.PhotoImage(image=img)
-        lmain.imgtk = imgtk
-        lmain.configure(image=imgtk)
-        lmain.after(10, show_frame)
-
-    show_frame() # Start displaying the video feed
-
-    mosaic_window.protocol("WM_DELETE_WINDOW", lambda: (cap.release(), mosaic_window.destroy()))
+    session = WindowSession() # Backend session holding this window's face boxes
+
+    # Every displayed frame must be masked, so frames are never skipped: only the resolution adapts
+    controller = AdaptiveController(target_fps=TARGET_FPS, workers=2, max_interval=1)
+
+    def process(frame):
+        # Send the frame to the backend for mosaic processing
+        # (full face detection every 5 frames, optical flow moves the boxes in between; while the
+        # other worker creates the session, this frame gets a full detection without a session)
+        session_meta = session.meta()
+        meta = dict(session_meta, detect_interval=5) if session_meta is not None else {"detect_interval": 1}
+        # With client overlays the backend only returns the face boxes, and the faces are masked on
+        # the full resolution frame here (otherwise the masked inference frame is upscaled)
+        annotations = USE_CLIENT_OVERLAYS or MOSAIC_PREVIEW
+        if annotations:
+            meta["response"] = "annotations"
+        response = request_adaptive(controller, client, "/apply_mosaic", frame, meta, stream)
+        if session_meta is not None:
+            session.update(session_meta, response[0] if response is not None else None)
+        if (response is None or "error" in response[0]
+                or ("faces" not in response[0] if annotations else response[1] is None)):
+            # Never show the unmasked frame, skip it instead
+            print(f"Backend error: {response[0].get('error') if response else 'no response'}")
+            return None
+        data, processed_frame = response
+        if MOSAIC_PREVIEW:
+            return overlay.draw_mosaic_preview(frame, data), data
+        if annotations:
+            with metrics.timer("mosaic"):
+                return mosaic_faces(frame, data["faces"]), data
+        return processed_frame, data
+
+    pipeline = FramePipeline(cap, process, workers=2, pace_fps=pace_fps).start()
+    show_pipeline(mosaic_window, lmain, pipeline)
 
 # Function3: detect features(eyes, nose, and mouth)
-def detect_features():
+def detect_features(source="0"):
     # Activate the backend file
-    start_flask_server("detect_features.py", "http://127.0.0.1:5002")
+    client = start_backend("detect_features")
 
-    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
+    cap, pace_fps = open_source(source)
     if not cap.isOpened():
-        print("Cannot open camera")
+        print(f"Cannot open video source: {source}")
         return
+    stream = next(stream_ids)
 
     # Create a new window to display the video feed
     features_window = tk.Toplevel(root)
-    features_window.title("Detect Features")
+    features_window.title(f"Detect Features - {source}")
     lmain = tk.Label(features_window)
     lmain.pack()
 
-    def show_frame():
-        ret, frame = cap.read()
-        if not ret:
-            print("Cannot receive frame")
-            return
-
-        # Reduce size to speed up
-        frame = cv2.resize(frame, (640, 320)) 
-
-        # Encode the frame to send to the server
-        _, buffer = cv2.imencode(".jpg", frame) 
-        frame_str = base64.b64encode(buffer).decode("utf-8")
-
-        try:
-            # Send the frame to the backend for feature detection
-            response = requests.post("http://127.0.0.1:5002/detect_features", json={"frame": frame_str})
-            data = response.json()
-
-            # Decode the processed frame
-            frame_str = base64.b64decode(data["frame"])
-            nparr = np.frombuffer(frame_str, np.uint8)
-            processed_frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)   
-
-        except requests.exceptions.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-            print(f"Response content: {response.content}")
-            return
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
-            return
-            
-        # Convert frame to image and display in Tkinter window
-        img = Image.fromarray(cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB))
-        imgtk = ImageTk.PhotoImage(image=img)
-        lmain.imgtk = imgtk
-        lmain.configure(image=imgtk)
-        lmain.after(10, show_frame)
-
-    show_frame() # Start displaying the video feed
-
-    features_window.protocol("WM_DELETE_WINDOW", lambda: (cap.release(), features_window.destroy()))
+    controller = AdaptiveController(target_fps=TARGET_FPS, workers=2)
+    last_results = None # Drawn again on the frames that are not sent
+
+    def process(frame):
+        nonlocal last_results
+        if not controller.should_send():
+            return (overlay.draw_features(frame, last_results) if last_results else frame), None
+
+        # Send the frame to the backend for feature detection
+        # Search the features inside detected faces only (much less cascade work)
+        response = request_adaptive(controller, client, "/detect_features", frame,
+                                    response_meta({"mode": "hierarchical"}), stream)
+        if response is None or "error" in response[0]:
+            return frame, None
+        data, processed_frame = response
+        if processed_frame is None: # Annotations only: draw the features locally
+            last_results = data
+            processed_frame = overlay.draw_features(frame, data)
+        return processed_frame, data
+
+    pipeline = FramePipeline(cap, process, workers=2, pace_fps=pace_fps).start()
+    show_pipeline(features_window, lmain, pipeline)
 
 # Function 4: single object tracking
-def single_object_tracking():
+def single_object_tracking(source="0"):
     # Activate the backend file
-    start_flask_server("single_object_tracking.py", "http://127.0.0.1:5003")
+    client = start_backend("single_object_tracking")
 
     tracking = False # track state flag
+    session_id = None # Backend tracking session
 
-    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
+    cap, pace_fps = open_source(source)
     if not cap.isOpened():
-        print("Cannot open camera")
+        print(f"Cannot open video source: {source}")
         return
+    stream = next(stream_ids)
 
     # Create a new window to display the video feed
     tracking_window = tk.Toplevel(root)
-    tracking_window.title("Single Object Tracking")
+    tracking_window.title(f"Single Object Tracking - {source}")
     lmain = tk.Label(tracking_window)
     lmain.pack()
 
+    # The tracker keeps its state at one resolution, so only the number of skipped frames adapts
+    controller = AdaptiveController(target_fps=TARGET_FPS, workers=1, scales=(1.0,))
+    last_results = None # Drawn again on the frames that are not sent
+
+    # Newest selection (frame, initialize request), sent by the pipeline's worker rather than on the
+    # Tk thread, so a slow backend doesn't freeze the window and no track request races with it
+    selections = queue.Queue(maxsize=1)
+
     def select_roi(event=None):
-        nonlocal tracking
-        ret, frame = cap.read() # Use the latest frame from show_frame to select ROI
-        if not ret:
+        frame = pipeline.latest_frame() # Use the latest captured frame to select ROI
+        if frame is None:
             print("Cannot receive frame")
             return
-        frame = cv2.resize(frame, (640, 320)) # Reduce size to speed up
         
         # Let the user select the object to track
         roi = cv2.selectROI("Select Object", frame, showCrosshair=False, fromCenter=False)
-
-        # Encode the frame to send to the server
-        _, buffer = cv2.imencode(".jpg", frame) 
-        frame_str = base64.b64encode(buffer).decode("utf-8")
         roi_list = [roi[0], roi[1], roi[2], roi[3]] # (x, y, w, h)
 
-        try:
-            # Send the frame and selected ROI to the backend to initialize tracking 
-            response = requests.post("http://127.0.0.1:5003/object_tracking", 
-                                    json={"frame": frame_str, "roi": roi_list, "mode": "initialize"})
-            
-            if response.status_code == 200:
-                tracking = True
-            print(response.json())
-
-        except requests.exceptions.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-            print(f"Response content: {response.content}")
-            return
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
-            return
-
-    def show_frame():
-        nonlocal tracking
-        ret, frame = cap.read()
-        if not ret:
-            print("Cannot receive frame")
+        # Send the frame and selected ROI (at the inference resolution) to the backend to initialize tracking 
+        _, scale = controller.resize(frame)
+        roi_list = overlay.scale_results({"box": roi_list}, scale)["box"]
+        put_latest(selections, (frame, {"roi": roi_list, "mode": "initialize", "tracker": TRACKER}))
+
+    # Worker: initialize tracking on a selected frame, replacing this window's previous session
+    def initialize(frame, meta):
+        nonlocal tracking, session_id, last_results
+        if session_id is not None:
+            meta = dict(meta, session_id=session_id) # The backend drops the previous session
+        response = request_adaptive(controller, client, "/object_tracking", frame, meta, stream)
+        if response is None:
             return
-
-        # Reduce size to speed up
-        frame = cv2.resize(frame, (640, 320)) 
-
-        if tracking:
-            # Encode the frame to send to the server
-            _, buffer = cv2.imencode(".jpg", frame) 
-            frame_str = base64.b64encode(buffer).decode("utf-8")            
-
-            try:
-                # Send the frame and selected ROI to the backend to initialize tracking 
-                response = requests.post("http://127.0.0.1:5003/object_tracking", 
-                json={"frame": frame_str, "mode": "track"})
-                data = response.json()
-
-                # Decode the processed frame
-                frame_str = base64.b64decode(data["frame"])
-                nparr = np.frombuffer(frame_str, np.uint8)
-                processed_frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)  
-
-            except requests.exceptions.JSONDecodeError as e:
-                print(f"JSON decode error: {e}")
-                print(f"Response content: {response.content}")
-                return
-            except requests.exceptions.RequestException as e:
-                print(f"Request failed: {e}")
-                return                 
-        else:
+        data, _ = response
+        if "error" not in data:
+            session_id = data["session_id"] # The backend keeps this window's trackers under this id
+            tracking = True
+            last_results = None
+        print(data)
+
+    def process(frame):
+        nonlocal tracking, last_results
+        try:
+            initialize(*selections.get_nowait())
+        except queue.Empty:
+            pass
+        if not tracking:
             # If not tracking, use the current frame
-            processed_frame = frame
-
-        # Convert frame to image and display in Tkinter window
-        img = Image.fromarray(cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB))
-        imgtk = ImageTk.PhotoImage(image=img)
-        lmain.imgtk = imgtk
-        lmain.configure(image=imgtk)
-        lmain.after(10, show_frame)
+            return frame, None
+        if not controller.should_send():
+            return (overlay.draw_tracks(frame, last_results) if last_results else frame), None
+
+        # Send the frame to the backend to track the selected object
+        meta = response_meta({"mode": "track", "session_id": session_id})
+        response = request_adaptive(controller, client, "/object_tracking", frame, meta, stream)
+        if response is None or "error" in response[0]:
+            if response is not None:
+                print(f"Backend error: {response[0]['error']}")
+                tracking = False # e.g. the session expired: press "a" to select again
+            return frame, None
+        data, processed_frame = response
+        if processed_frame is None: # Annotations only: draw the tracked boxes locally
+            last_results = data
+            processed_frame = overlay.draw_tracks(frame, data)
+        return processed_frame, data
+
+    # Tracking is stateful on the backend, so frames are sent in order by a single worker
+    pipeline = FramePipeline(cap, process, workers=1, pace_fps=pace_fps).start()
 
     # Bind the "a" key to select an object to track(only bind once)
     tracking_window.bind("<KeyPress-a>", lambda event: select_roi())
     
-    show_frame()  # Start displaying the video feed
-
-    tracking_window.protocol("WM_DELETE_WINDOW", lambda: (cap.release(), tracking_window.destroy()))
+    show_pipeline(tracking_window, lmain, pipeline)
 
 # Function 5: multiple object tracking
-def multi_object_tracking():
+def multi_object_tracking(source="0"):
     # Activate the backend file
-    start_flask_server("multi_object_tracking.py", "http://127.0.0.1:5004")
+    client = start_backend("multi_object_tracking")
 
     tracking = False # Track state flag
-    selected_rois = [] # Store ROIs selected by the user
+    session_id = None # Backend tracking session
 
-    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
+    cap, pace_fps = open_source(source)
     if not cap.isOpened():
-        print("Cannot open camera")
+        print(f"Cannot open video source: {source}")
         return
+    stream = next(stream_ids)
 
     # Create a new window to display the video feed
     tracking_window = tk.Toplevel(root)
-    tracking_window.title("Multi Object Tracking")
+    tracking_window.title(f"Multi Object Tracking - {source}")
     lmain = tk.Label(tracking_window)
     lmain.pack()
 
     # Label to show instructions for selecting objects
-    instruction_label = tk.Label(tracking_window, text="Press 'a' to select up to 3 objects for tracking", font=("Helvetica", 12))
+    instruction_label = tk.Label(tracking_window, text="Press 'a' to select objects for tracking (Enter after each, Esc when done)", font=("Helvetica", 12))
     instruction_label.pack(pady=10)
 
-    # Prompt the user to select three objects
+    # The trackers keep their state at one resolution, so only the number of skipped frames adapts
+    controller = AdaptiveController(target_fps=TARGET_FPS, workers=1, scales=(1.0,))
+    last_results = None # Drawn again on the frames that are not sent
+
+    # Newest selection (frame, initialize request), sent by the pipeline's worker rather than on the
+    # Tk thread, so a slow backend doesn't freeze the window and no track request races with it
+    selections = queue.Queue(maxsize=1)
+
+    # Prompt the user to select the objects to track
     def select_rois(event=None):
-        nonlocal tracking
-        ret, frame = cap.read()
-        if not ret:
+        frame = pipeline.latest_frame() # Use the latest captured frame to select ROIs
+        if frame is None:
             print("Cannot receive frame")
             return
-        frame = cv2.resize(frame, (640, 320)) # Reduce size to speed up
-
-        # Prompt the user to select three objects
-        num_selected = 0
-        max_objects = 3
-
-        while num_selected < max_objects: # Select up to 3 objects for tracking
-            cv2.imshow(f"Select Object {num_selected + 1} / {max_objects}", frame)
-            roi = cv2.selectROI(f"Select Object {num_selected + 1} / {max_objects}", frame, showCrosshair=False, fromCenter=False)
-            if roi != (0, 0, 0, 0): # Ensure valid ROI
-                selected_rois.append(list(roi))
-                num_selected += 1
-                print(f"Selected {num_selected} objects")
-            else:
-                print("Invalid selection, please try again.")
-
-            # Close the OpenCV ROI window to avoid multiple windows
-            cv2.destroyAllWindows()
-
-        # Encode the frame to send to the server
-        _, buffer = cv2.imencode(".jpg", frame) 
-        frame_str = base64.b64encode(buffer).decode("utf-8")
-
-        try:              
-            # Send the frame and selected ROI to the backend to initialize tracking 
-            response = requests.post("http://127.0.0.1:5004/object_tracking", 
-                                    json={"frame": frame_str, "rois": selected_rois, "mode": "initialize"})
-            
-            if response.status_code == 200:
-                tracking = True
-            print(response.json())
 
-        except requests.exceptions.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-            print(f"Response content: {response.content}")
-            return
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
+        # Select any number of objects: Enter (or Space) after each box, Esc when done
+        # Every press of "a" starts a new selection (the previous objects are replaced)
+        rois = cv2.selectROIs("Select Objects", frame, showCrosshair=False, fromCenter=False)
+        cv2.destroyAllWindows() # Close the OpenCV ROI window to avoid multiple windows
+        selected_rois = [list(map(int, roi)) for roi in rois if roi[2] > 0 and roi[3] > 0] # Ensure valid ROIs
+        if not selected_rois:
+            print("No object selected.")
             return
-
-    def show_frame():
-        nonlocal tracking
-        ret, frame = cap.read()
-        if not ret:
-            print("Cannot receive frame")
+        print(f"Selected {len(selected_rois)} objects")
+
+        # Send the frame and selected ROIs (at the inference resolution) to the backend to initialize tracking 
+        _, scale = controller.resize(frame)
+        rois = overlay.scale_results({"boxes": selected_rois}, scale)["boxes"]
+        put_latest(selections, (frame, {"rois": rois, "mode": "initialize", "tracker": TRACKER}))
+
+    # Worker: initialize tracking on a selected frame, replacing this window's previous session
+    def initialize(frame, meta):
+        nonlocal tracking, session_id, last_results
+        if session_id is not None:
+            meta = dict(meta, session_id=session_id) # The backend drops the previous session
+        response = request_adaptive(controller, client, "/object_tracking", frame, meta, stream)
+        if response is None:
             return
-
-        # Reduce size to speed up
-        frame = cv2.resize(frame, (640, 320)) 
-
-        if tracking:
-            # Encode the frame to send to the server
-            _, buffer = cv2.imencode(".jpg", frame) 
-            frame_str = base64.b64encode(buffer).decode("utf-8")            
-
-            try:
-                # Send the frame and selected ROI to the backend to initialize tracking 
-                response = requests.post("http://127.0.0.1:5004/object_tracking", 
-                json={"frame": frame_str, "mode": "track"})
-                data = response.json()
-
-                # Decode the processed frame
-                frame_str = base64.b64decode(data["frame"])
-                nparr = np.frombuffer(frame_str, np.uint8)
-                processed_frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)   
-
-            except requests.exceptions.JSONDecodeError as e:
-                print(f"JSON decode error: {e}")
-                print(f"Response content: {response.content}")
-                return
-            except requests.exceptions.RequestException as e:
-                print(f"Request failed: {e}")
-                return
-        else:
+        data, _ = response
+        if "error" not in data:
+            session_id = data["session_id"] # The backend keeps this window's trackers under this id
+            tracking = True
+            last_results = None
+        print(data)
+
+    def process(frame):
+        nonlocal tracking, last_results
+        try:
+            initialize(*selections.get_nowait())
+        except queue.Empty:
+            pass
+        if not tracking:
             # If not tracking, use the current frame
-            processed_frame = frame
-
-        # Convert frame to image and display in Tkinter window
-        img = Image.fromarray(cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB))
-        imgtk = ImageTk.PhotoImage(image=img)
-        lmain.imgtk = imgtk
-        lmain.configure(image=imgtk)
-        lmain.after(10, show_frame)
+            return frame, None
+        if not controller.should_send():
+            return (overlay.draw_tracks(frame, last_results) if last_results else frame), None
+
+        # Send the frame to the backend to track the selected objects
+        meta = response_meta({"mode": "track", "session_id": session_id})
+        response = request_adaptive(controller, client, "/object_tracking", frame, meta, stream)
+        if response is None or "error" in response[0]:
+            if response is not None:
+                print(f"Backend error: {response[0]['error']}")
+                tracking = False # e.g. the session expired: press "a" to select again
+            return frame, None
+        data, processed_frame = response
+        if processed_frame is None: # Annotations only: draw the tracked boxes locally
+            last_results = data
+            processed_frame = overlay.draw_tracks(frame, data)
+        return processed_frame, data
+
+    # Tracking is stateful on the backend, so frames are sent in order by a single worker
+    pipeline = FramePipeline(cap, process, workers=1, pace_fps=pace_fps).start()
 
     # Bind the "a" key to select objects to track(only bind once)
     tracking_window.bind("<KeyPress-a>", select_rois)
 
-    show_frame() # Start displaying the video feed
-
-    tracking_window.protocol("WM_DELETE_WINDOW", lambda: (cap.release(), tracking_window.destroy()))
+    show_pipeline(tracking_window, lmain, pipeline)
 
 # Configuration of function buttons
 buttons = [
@@ -507,10 +662,38 @@ buttons = [
     ("Activate multiple object tracking", multi_object_tracking, "#ffccff"), # light purple background
 ]
 
+# Video sources, separated by commas: every feature opens one window (one pipeline) per source
+sources_frame = tk.Frame(content_frame, bg="#d0d0d0")
+sources_frame.pack(pady=5)
+tk.Label(sources_frame, text="Video sources:", bg="#d0d0d0", fg="#333", font=("Helvetica", 11)).pack(side="left")
+sources_entry = tk.Entry(sources_frame, width=45, font=("Helvetica", 11))
+sources_entry.insert(0, ", ".join(DEFAULT_SOURCES))
+sources_entry.pack(side="left", padx=5)
+
+# Helper function to run a feature on every source (the streams share the backend and its connections)
+def open_streams(feature):
+    sources = [source.strip() for source in sources_entry.get().split(",") if source.strip()]
+    for source in sources or ["0"]:
+        feature(source)
+
 # Put buttons
 for text, command, color in buttons:
-    btn = create_button(text, command, color)
+    btn = create_button(text, lambda command=command: open_streams(command), color)
     btn.pack(pady=15) # The space between each button  
 
+# Label showing the backend startup progress
+status_label = tk.Label(content_frame, text="", bg="#d0d0d0", fg="#333", font=("Helvetica", 11))
+status_label.pack(pady=5)
+
+# Helper function to show a status message in the main window (and the console)
+def show_status(text):
+    print(text)
+    status_label.config(text=text)
+    root.update_idletasks()
+
 # Operate main loop
-root.mainloop()
\ No newline at end of file
+root.mainloop()
+close_clients()
+stop_backends()
+if frame_ring is not None:
+    frame_ring.close()
\ No newline at end of file
@@ -0,0 +1,301 @@
+import itertools
+import socket
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from frame_transport import decode_image, encode_jpeg, post_frame, recv_message, send_message
+from shared_frames import SHARED_FRAME
+
+# Default (connect, read) timeouts in seconds for one backend call
+DEFAULT_TIMEOUT = (1.0, 5.0)
+
+# Sessions whose frames a BackendClient serializes before it forgets the idle ones
+MAX_SESSION_LOCKS = 64
+
+# Divides the request slots of one backend server fairly among the streams using it
+# A free slot goes to the waiting stream with the fewest requests in flight, then to the one served
+# least recently (round robin), so a stream with several workers can't starve the others
+class FairScheduler:
+    def __init__(self, capacity=4):
+        self.capacity = capacity
+        self.in_flight = {} # Stream -> requests in flight
+        self.waiting = [] # (stream, ticket) in arrival order
+        self.last_served = {} # Stream -> ticket of its last granted request
+        self.tickets = itertools.count()
+        self.total = 0
+        self.cond = threading.Condition()
+
+    def next_waiter(self):
+        return min(self.waiting, key=lambda waiter: (self.in_flight.get(waiter[0], 0),
+                                                     self.last_served.get(waiter[0], -1), waiter[1]))
+
+    def acquire(self, stream):
+        with self.cond:
+            waiter = (stream, next(self.tickets))
+            self.waiting.append(waiter)
+            while self.total >= self.capacity or self.next_waiter() != waiter:
+                self.cond.wait()
+            self.waiting.remove(waiter)
+            self.in_flight[stream] = self.in_flight.get(stream, 0) + 1
+            self.last_served[stream] = next(self.tickets)
+            self.total += 1
+            self.cond.notify_all() # The next waiter may fit in a remaining slot
+
+    def release(self, stream):
+        with self.cond:
+            self.in_flight[stream] -= 1
+            if not self.in_flight[stream]:
+                del self.in_flight[stream]
+            self.total -= 1
+            self.cond.notify_all()
+
+    @contextmanager
+    def slot(self, stream):
+        self.acquire(stream)
+        try:
+            yield
+        finally:
+            self.release(stream)
+
+# Helper function to create a pooled HTTP session (keep-alive, bounded pool, retries)
+def make_session(pool_size=4, retries=2):
+    # Only connection errors (and idempotent GETs) are retried, so a frame is never processed twice
+    # 503 is not retried: it means "busy" (or "not ready yet") and the caller decides what to do
+    retry = Retry(total=retries, connect=retries, read=0, backoff_factor=0.1,
+                  status_forcelist=(502, 504), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Persistent HTTP client for one backend (keep-alive, bounded pool, timeouts, retries)
+# Clients of routes on the same server can share one session and one scheduler
+# With a shared memory ring (same machine only), frames are passed raw instead of as JPEG
+class BackendClient:
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT, pool_size=4, retries=2, binary=True,
+                 session=None, scheduler=None, ring=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.binary = binary
+        self.ring = ring
+        self.owns_session = session is None
+        self.session = session or make_session(pool_size, retries)
+        self.scheduler = scheduler or FairScheduler(pool_size)
+        self.session_locks = {} # Backend session id -> lock held while one of its frames is in flight
+        self.session_locks_lock = threading.Lock()
+
+    # Frames of one backend session (e.g. a mosaic window's optical flow state) are sent one at a
+    # time, like the frames sharing a key on a stream, so the backend never sees them out of order
+    @contextmanager
+    def session_order(self, meta):
+        session_id = (meta or {}).get("session_id")
+        if session_id is None:
+            yield
+            return
+        with self.session_locks_lock:
+            if session_id not in self.session_locks and len(self.session_locks) >= MAX_SESSION_LOCKS:
+                for key in [key for key, lock in self.session_locks.items() if not lock.locked()]:
+                    del self.session_locks[key]
+            lock = self.session_locks.setdefault(session_id, threading.Lock())
+        with lock:
+            yield
+
+    def url(self, route):
+        return f"{self.base_url}/{route.lstrip('/')}"
+
+    def get(self, route="/", timeout=None):
+        return self.session.get(self.url(route), timeout=timeout or self.timeout)
+
+    # Send a frame to a route and return (results, processed frame)
+    # With a stream key, the request waits for its fair share of the server's slots (after the
+    # previous frame of its session, so a waiting frame doesn't hold a slot)
+    def post_frame(self, route, frame, meta=None, timeout=None, stream=None):
+        with self.session_order(meta):
+            if stream is None:
+                return post_frame(self.session, self.url(route), frame, meta, binary=self.binary,
+                                  ring=self.ring, timeout=timeout or self.timeout)
+            with self.scheduler.slot(stream):
+                return post_frame(self.session, self.url(route), frame, meta, binary=self.binary,
+                                  ring=self.ring, timeout=timeout or self.timeout)
+
+    def close(self):
+        if self.owns_session:
+            self.session.close()
+
+# Persistent streaming connection to a backend's stream server (see stream_server.py)
+# Frames are pushed with sequence numbers without waiting for the previous result, up to max_in_flight
+# at a time, and each result is handed to the request that sent the frame as soon as it arrives
+class StreamConnection:
+    def __init__(self, host, port, max_in_flight=4, timeout=DEFAULT_TIMEOUT):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.scheduler = FairScheduler(max_in_flight)
+        self.pending = {} # Seq -> Future of (results, processed frame)
+        self.abandoned = {} # Seq of a frame given up on -> (ring, slot) the backend may still be reading
+        self.seqs = itertools.count()
+        self.sock = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        sock = socket.create_connection(self.address, timeout=self.timeout[0])
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(None)
+        self.sock = sock
+        threading.Thread(target=self.read_loop, args=(sock,), daemon=True).start()
+
+    def read_loop(self, sock):
+        try:
+            while True:
+                message = recv_message(sock)
+                if message is None:
+                    raise ConnectionError("Stream closed by the backend.")
+                header, body = message
+                with self.lock:
+                    future = self.pending.pop(header["seq"], None)
+                    late = self.abandoned.pop(header["seq"], None)
+                if late is not None:
+                    late[0].release(late[1]) # The backend is done with the slot of a frame given up on
+                if future is None:
+                    continue # Late result of a frame that was already given up on: drop it
+                future.set_result((header["results"], decode_image(body) if body else None))
+        except (OSError, ValueError) as e:
+            self.fail(sock, e)
+
+    # Fail every frame in flight (the next frame reconnects)
+    def fail(self, sock, error):
+        with self.lock:
+            if self.sock is sock:
+                self.sock = None
+            pending, self.pending = self.pending, {}
+            abandoned, self.abandoned = self.abandoned, {}
+        sock.close()
+        for ring, slot in abandoned.values():
+            ring.release(slot) # The backend won't answer on this connection any more
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"Stream failed: {error}"))
+
+    # Send a frame, returns a Future of (results, processed frame)
+    # Frames sharing a key (e.g. a tracking session) are processed by the backend in order
+    # (frame None: the frame is in shared memory, referenced by the metadata)
+    def submit(self, route, frame, meta=None, key=None):
+        body = encode_jpeg(frame) if frame is not None else b""
+        self.slots.acquire() # At most max_in_flight frames on the wire
+        future = Future()
+        future.add_done_callback(lambda _: self.slots.release())
+        future.seq = seq = next(self.seqs)
+        with self.lock:
+            try:
+                if self.sock is None:
+                    self.connect()
+                self.pending[seq] = future
+                send_message(self.sock, {"seq": seq, "route": route, "meta": meta or {}, "key": key}, body)
+            except OSError as e:
+                self.pending.pop(seq, None)
+                future.set_exception(e)
+        return future
+
+    # Send a frame and wait for its result, like BackendClient.post_frame
+    # With a shared memory ring, the frame is passed raw through one of its slots (as JPEG when every
+    # slot is still held by frames the backend hasn't answered yet)
+    def request(self, route, frame, meta=None, timeout=None, key=None, ring=None):
+        slot = None
+        if ring is not None and ring.fits(frame):
+            slot = ring.acquire(blocking=False)
+        if slot is not None:
+            meta = dict(meta or {}, **{SHARED_FRAME: ring.write(slot, frame)})
+            frame = None
+        try:
+            future = self.submit(route, frame, meta, key)
+            try:
+                results, processed_frame = future.result(timeout=timeout or self.timeout[1])
+            except FutureTimeout:
+                with self.lock:
+                    given_up = self.pending.pop(getattr(future, "seq", None), None) is not None
+                    if given_up and slot is not None:
+                        # The backend may still be reading the slot: it is released when the late
+                        # result arrives or the connection fails, not reused for the next frame
+                        self.abandoned[future.seq] = (ring, slot)
+                        slot = None
+                future.cancel() # Frees the in-flight slot, a late result will be dropped
+                raise TimeoutError("No result from the stream in time.")
+            ref = results.pop(SHARED_FRAME, None)
+            if ref is not None:
+                processed_frame = ring.read(ref)
+            return results, processed_frame
+        finally:
+            if slot is not None:
+                ring.release(slot)
+
+    def close(self):
+        with self.lock:
+            sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR) # Wakes the reader, which fails (and frees) what is in flight
+            except OSError:
+                pass
+            self.fail(sock, ConnectionError("Stream closed."))
+
+# Routes of one pipeline reached over a StreamConnection, with the same post_frame as BackendClient
+class StreamClient:
+    def __init__(self, connection, prefix="", ring=None):
+        self.connection = connection
+        self.prefix = prefix.rstrip("/")
+        self.ring = ring
+
+    def post_frame(self, route, frame, meta=None, timeout=None, stream=None):
+        meta = dict(meta or {})
+        key = meta.get("session_id") # Frames of one session must be processed in order
+        route = self.prefix + "/" + route.lstrip("/")
+        if stream is None:
+            return self.connection.request(route, frame, meta, timeout, key, self.ring)
+        with self.connection.scheduler.slot(stream):
+            return self.connection.request(route, frame, meta, timeout, key, self.ring)
+
+# One shared client per backend base URL, and one session + scheduler per server
+_clients = {}
+_servers = {}
+_streams = {}
+_clients_lock = threading.Lock()
+
+# Helper function to get (or create) the shared client of a backend
+def get_client(base_url, pool_size=4, retries=2, **kwargs):
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            parts = urlsplit(base_url)
+            server = (parts.scheme, parts.netloc)
+            if server not in _servers:
+                _servers[server] = (make_session(pool_size, retries), FairScheduler(pool_size))
+            session, scheduler = _servers[server]
+            client = BackendClient(base_url, session=session, scheduler=scheduler, **kwargs)
+            _clients[base_url] = client
+        return client
+
+# Helper function to get a client of a pipeline's routes over the shared stream connection of a server
+def get_stream_client(host, port, prefix="", max_in_flight=4, ring=None):
+    with _clients_lock:
+        connection = _streams.get((host, port))
+        if connection is None:
+            connection = StreamConnection(host, port, max_in_flight)
+            _streams[(host, port)] = connection
+        return StreamClient(connection, prefix, ring)
+
+# Helper function to close every shared client (on application exit)
+def close_clients():
+    with _clients_lock:
+        for session, _ in _servers.values():
+            session.close()
+        for connection in _streams.values():
+            connection.close()
+        _clients.clear()
+        _servers.clear()
+        _streams.clear()
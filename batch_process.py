@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import cv2
+import numpy as np
+from frame_transport import to_json
+from tracking_engine import ADAPTIVE, DEFAULT_TRACKER, TRACKERS
+
+# Pipelines that can be run over recorded footage
+PIPELINES = ("face_detection", "face_mosaic", "detect_features", "single_object_tracking", "multi_object_tracking")
+
+# Files read from an image directory
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+# Helper function to read the frames of a video file as (frame index, frame)
+def read_video(cap):
+    index = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield index, frame
+        index += 1
+    cap.release()
+
+# Helper function to read the images of a directory (sorted by name) as (file name, image)
+def read_images(directory):
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        frame = cv2.imread(os.path.join(directory, name))
+        if frame is None:
+            print(f"Skipping unreadable image: {name}")
+            continue
+        yield name, frame
+
+# Helper function to open a video file or image directory, returns (frames, fps, is directory)
+def open_source(path):
+    if os.path.isdir(path):
+        return read_images(path), None, True
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video: {path}")
+    return read_video(cap), cap.get(cv2.CAP_PROP_FPS) or 30.0, False
+
+# Helper function to map fn over items on a pool, yielding results in input order
+# (at most max_in_flight frames are decoded and waiting, so memory stays bounded on long videos)
+def ordered_map(pool, fn, items, max_in_flight):
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+# Worker process setup: every process already runs one frame at a time, so keep OpenCV single threaded
+def init_worker():
+    cv2.setNumThreads(1)
+
+# Stateless stages, run in worker processes: (name, frame) -> (name, annotated frame, results)
+def mosaic_frame(options, item):
+    from face_mosaic import detect_faces, mosaic_faces
+    name, frame = item
+    faces = detect_faces(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    frame = mosaic_faces(frame, faces, method=options["method"], block_size=options["block_size"])
+    return name, frame, {"faces": faces}
+
+def features_frame(options, item):
+    from detect_features import find_features, find_features_in_faces, draw_features
+    name, frame = item
+    if options["mode"] == "hierarchical":
+        features = find_features_in_faces(frame)
+    else:
+        features = find_features(frame)
+    return name, draw_features(frame, features), features
+
+# Face matching stage, run on threads of the main process (FaceNet is loaded once and
+# the concurrent frames share batched embedding passes)
+def face_frame(reference_embedding, item):
+    from face_detection import get_all_face_embeddings, compare_all_faces, gallery
+    name, frame = item
+    embeddings, bboxes = get_all_face_embeddings(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    faces = []
+    if bboxes:
+        if reference_embedding is not None:
+            matched, distances = compare_all_faces(embeddings, reference_embedding)
+            faces = [{"box": bbox, "matched": m, "distance": d} for bbox, m, d in zip(bboxes, matched, distances)]
+        else:
+            for bbox, matches in zip(bboxes, gallery.match(embeddings)):
+                best = matches[0] if matches and matches[0]["matched"] else None
+                faces.append({"box": bbox, "matched": best is not None, "name": best["name"] if best else None})
+    for face in faces:
+        x, y, w, h = face["box"]
+        color = (0, 255, 0) if face["matched"] else (0, 0, 255) # Green if matched, red if not
+        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+        if face.get("name"):
+            cv2.putText(frame, face["name"], (x, max(y - 8, 0)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    return name, frame, {"faces": faces}
+
+# Stateful stages, run in order in the main process
+def propagated_mosaic_frames(options, items):
+    from face_mosaic import FacePropagator, mosaic_faces
+    face_propagator = FacePropagator(detect_interval=options["detect_interval"])
+    for name, frame in items:
+        faces, detected = face_propagator.update(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+        frame = mosaic_faces(frame, faces, method=options["method"], block_size=options["block_size"])
+        yield name, frame, {"faces": faces, "detected": detected}
+
+def single_tracking_frames(roi, items, tracker=DEFAULT_TRACKER):
+    from single_object_tracking import TrackingSession, initialize_tracker, update_tracker, draw_box
+    session = TrackingSession()
+    for index, (name, frame) in enumerate(items):
+        if index == 0:
+            initialize_tracker(frame, tuple(roi), session, tracker)
+            box = list(roi)
+        else:
+            box = update_tracker(frame, session)
+        yield name, draw_box(frame, box), {"box": box, "success": box is not None}
+
+def multi_tracking_frames(rois, items, tracker=DEFAULT_TRACKER):
+    from multi_object_tracking import TrackingSession, initialize_tracker, update_trackers, draw_boxes
+    session = TrackingSession()
+    for index, (name, frame) in enumerate(items):
+        if index == 0:
+            tracks = initialize_tracker(frame, rois, session, tracker)
+        else:
+            tracks = update_trackers(frame, session)
+        yield name, draw_boxes(frame, tracks), {"tracks": tracks}
+
+# Helper function to parse an "x,y,w,h" box argument
+def parse_box(text):
+    box = [int(v) for v in text.split(",")]
+    if len(box) != 4:
+        raise argparse.ArgumentTypeError(f"Expected x,y,w,h, got: {text}")
+    return box
+
+# Helper function to compute the reference embedding of a face matching run
+def load_reference(path):
+    from face_detection import get_face_embeddings
+    image = cv2.imread(path)
+    if image is None:
+        raise RuntimeError(f"Cannot read reference image: {path}")
+    embedding, _ = get_face_embeddings(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    return np.asarray(embedding)
+
+# Helper function to run the selected pipeline over the frames, yielding (name, annotated frame, results)
+def run_pipeline(args, frames):
+    options = {"method": args.method, "block_size": args.block_size,
+               "detect_interval": args.detect_interval, "mode": args.mode}
+    if args.pipeline == "face_mosaic" and args.detect_interval > 1:
+        yield from propagated_mosaic_frames(options, frames)
+    elif args.pipeline in ("face_mosaic", "detect_features"):
+        # Stateless: frames are spread over worker processes and written back in order
+        stage = mosaic_frame if args.pipeline == "face_mosaic" else features_frame
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as pool:
+            yield from ordered_map(pool, partial(stage, options), frames, args.workers * 2)
+    elif args.pipeline == "face_detection":
+        from model_registry import models
+        models.get("facenet", timeout=None) # Wait for the background load (raises if it failed)
+        reference_embedding = load_reference(args.reference) if args.reference else None
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            yield from ordered_map(pool, partial(face_frame, reference_embedding), frames, args.workers * 2)
+    elif args.pipeline == "single_object_tracking":
+        if not args.roi:
+            raise SystemExit("single_object_tracking needs --roi x,y,w,h (box of the object in the first frame)")
+        yield from single_tracking_frames(args.roi[0], frames, args.tracker)
+    else:
+        if not args.roi:
+            raise SystemExit("multi_object_tracking needs --roi x,y,w,h (one per object, in the first frame)")
+        yield from multi_tracking_frames(args.roi, frames, args.tracker)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a pipeline over a video file or a directory of images")
+    parser.add_argument("pipeline", choices=PIPELINES)
+    parser.add_argument("source", help="video file or directory of images")
+    parser.add_argument("--output", help="annotated video (video source) or image directory (image source)")
+    parser.add_argument("--json", help="write the per-frame results as JSON lines")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes/threads")
+    parser.add_argument("--method", choices=["pixelate", "blur", "fill"], default="pixelate", help="face_mosaic effect")
+    parser.add_argument("--block-size", type=int, default=15, help="face_mosaic block size")
+    parser.add_argument("--detect-interval", type=int, default=1,
+                        help="face_mosaic: full detection every N frames, optical flow in between (runs sequentially)")
+    parser.add_argument("--mode", choices=["full", "hierarchical"], default="hierarchical", help="detect_features mode")
+    parser.add_argument("--reference", help="face_detection: image of the reference face (default: identify with the gallery)")
+    parser.add_argument("--roi", type=parse_box, action="append", help="tracking: x,y,w,h box in the first frame")
+    parser.add_argument("--tracker", choices=list(TRACKERS) + [ADAPTIVE], default=DEFAULT_TRACKER, help="tracking algorithm")
+    args = parser.parse_args()
+
+    if not args.output and not args.json:
+        parser.error("nothing to write, give --output and/or --json")
+
+    frames, fps, is_directory = open_source(args.source)
+    if args.output and is_directory:
+        os.makedirs(args.output, exist_ok=True)
+    writer = None
+    json_file = open(args.json, "w", encoding="utf-8") if args.json else None
+
+    start = time.perf_counter()
+    count = 0
+    try:
+        for name, frame, results in run_pipeline(args, frames):
+            if args.output and is_directory:
+                cv2.imwrite(os.path.join(args.output, name), frame)
+            elif args.output:
+                if writer is None:
+                    height, width = frame.shape[:2]
+                    writer = cv2.VideoWriter(args.output, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+                writer.write(frame)
+            if json_file:
+                json_file.write(json.dumps({"frame": name, **to_json(results)}) + "\n")
+
+            count += 1
+            if count % 100 == 0:
+                print(f"{count} frames, {count / (time.perf_counter() - start):.1f} frames/s")
+    finally:
+        if writer is not None:
+            writer.release()
+        if json_file:
+            json_file.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Processed {count} frames in {elapsed:.1f} s ({count / max(elapsed, 1e-9):.1f} frames/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+import psutil
+from frame_transport import post_frame
+from shared_frames import SharedFrameRing
+import scene_cache
+
+# Pipelines measured by the benchmark
+PIPELINES = ("face_mosaic", "detect_features", "face_detection", "single_object_tracking", "multi_object_tracking")
+
+# Helper function to create a reproducible clip: textured background with moving objects to track
+# Returns (frames, ground truth: the object boxes of every frame)
+def synthetic_clip(width, height, count, seed=0, objects=3):
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (7, 7), 0)
+    size = max(min(width, height) // 6, 16)
+    patches = [rng.integers(0, 256, (size, size, 3), dtype=np.uint8) for _ in range(objects)]
+    starts = [(width // 8, height // 4), (width // 2, height // 8), (width // 3, height // 2)]
+    starts += [((width // 8) * (1 + i % 6) + size // 3, (height // 8) * (1 + (i // 6) % 4) + size // 3)
+               for i in range(objects - 3)]
+    starts = starts[:objects]
+    frames, truth = [], []
+    for i in range(count):
+        frame = background.copy()
+        boxes = []
+        for patch, (x0, y0) in zip(patches, starts):
+            x = min(max(int(x0 + (width // 4) * np.sin(i / 20)), 0), width - size)
+            y = min(max(int(y0 + (height // 8) * np.cos(i / 25)), 0), height - size)
+            frame[y: y + size, x: x + size] = patch
+            boxes.append([x, y, size, size])
+        frames.append(frame)
+        truth.append(boxes)
+    return frames, truth
+
+# Helper function to create reproducible frames, returns (frames, object boxes in the first frame)
+def synthetic_frames(width, height, count, seed=0, objects=3):
+    frames, truth = synthetic_clip(width, height, count, seed, objects)
+    return frames, truth[0]
+
+# Helper function to read frames from a recorded video (tracked objects start in the middle of the frame)
+def recorded_frames(path, width, height, count, objects=3):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, (width, height)))
+    cap.release()
+    if not frames:
+        raise RuntimeError(f"Cannot read frames from {path}")
+    size = min(width, height) // 5
+    offsets = [-size * 2, 0, size * 2] + [(i // 2 + 2) * size * 2 * (-1 if i % 2 == 0 else 1) for i in range(objects - 3)]
+    boxes = [[min(max(width // 2 - size // 2 + dx, 0), width - size), height // 2 - size // 2, size, size]
+             for dx in offsets[:objects]]
+    return frames, boxes
+
+# Samples the resident memory of this process in the background and keeps the peak
+class PeakRSS:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+
+    def sample(self):
+        while not self.done.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self.done.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.process.memory_info().rss
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+        return False
+
+# In-process runners: build the per-frame function of a pipeline from the first frame and object boxes
+def inprocess_runner(pipeline, first_frame, boxes, args):
+    if pipeline == "face_mosaic":
+        from face_mosaic import detect_faces, mosaic_faces
+        return lambda frame: mosaic_faces(frame, detect_faces(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)))
+    if pipeline == "detect_features":
+        from detect_features import detect_features, draw_features, find_features_in_faces
+        if args.feature_mode == "hierarchical":
+            return lambda frame: draw_features(frame, find_features_in_faces(frame))
+        return detect_features
+    if pipeline == "face_detection":
+        from face_detection import get_all_face_embeddings, compare_faces
+        from model_registry import models
+        models.get("facenet", timeout=None) # Raises if FaceNet can't be loaded
+        reference = np.random.default_rng(0).normal(size=512).astype(np.float32)
+
+        def match(frame):
+            embeddings, _ = get_all_face_embeddings(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            return [compare_faces(embedding, reference) for embedding in embeddings]
+        return match
+    if pipeline == "single_object_tracking":
+        from single_object_tracking import TrackingSession, initialize_tracker, update_tracker, draw_box
+        session = TrackingSession()
+        initialize_tracker(first_frame, tuple(boxes[0]), session)
+        return lambda frame: draw_box(frame, update_tracker(frame, session))
+    from multi_object_tracking import TrackingSession, initialize_tracker, update_trackers, draw_boxes
+    session = TrackingSession()
+    initialize_tracker(first_frame, boxes, session)
+    return lambda frame: draw_boxes(frame, update_trackers(frame, session))
+
+# Adapter giving a Flask test client the requests.Session interface used by post_frame
+class TestClientHTTP:
+    class Response:
+        def __init__(self, response):
+            self.response = response
+            self.headers = response.headers
+            self.content = response.data
+
+        def json(self):
+            return self.response.get_json()
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, url, data=None, json=None, headers=None, **kwargs):
+        return self.Response(self.client.post(url, data=data, json=json, headers=headers))
+
+# Route and initialize metadata of each pipeline on the inference server
+ROUTES = {
+    "face_mosaic": ("/apply_mosaic", None),
+    "detect_features": ("/detect_features", None),
+    "face_detection": ("/detect_face", lambda boxes: {"mode": "initialize"}),
+    "single_object_tracking": ("/single/object_tracking", lambda boxes: {"mode": "initialize", "roi": boxes[0]}),
+    "multi_object_tracking": ("/multi/object_tracking", lambda boxes: {"mode": "initialize", "rois": boxes}),
+}
+
+# HTTP runners: every frame goes through the Flask endpoint (test client, or a running server with --url)
+def http_runner(pipeline, first_frame, boxes, args):
+    if args.url:
+        import requests
+        http, base_url = requests.Session(), args.url.rstrip("/")
+    else:
+        from inference_server import create_app
+        http, base_url = TestClientHTTP(create_app([pipeline])), ""
+        if pipeline == "face_detection":
+            from model_registry import models
+            models.get("facenet", timeout=None)
+
+    route, initialize = ROUTES[pipeline]
+    meta = {"mode": args.feature_mode} if pipeline == "detect_features" else {}
+    if initialize is not None:
+        data, _ = post_frame(http, base_url + route, first_frame, initialize(boxes), binary=not args.json_transport,
+                             ring=args.ring)
+        if "session_id" in data:
+            meta = {"mode": "track", "session_id": data["session_id"]}
+
+    def send(frame):
+        data, processed_frame = post_frame(http, base_url + route, frame, meta, binary=not args.json_transport,
+                                           ring=args.ring)
+        if "error" in data:
+            raise RuntimeError(data["error"])
+        return processed_frame
+    return send
+
+# Helper function to run one pipeline over the frames and summarize the latencies
+# baseline is the resident memory before the runner was built (its models loaded), so the increase
+# is the memory this pipeline added on top of what the process already held
+def measure(runner, frames, warmup, baseline):
+    for frame in frames[:warmup]:
+        runner(frame.copy())
+    latencies = []
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        for frame in frames[warmup:]:
+            frame = frame.copy()
+            t0 = time.perf_counter()
+            runner(frame)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        elapsed = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "frames": len(latencies),
+        "throughput_fps": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(float(np.mean(latencies)), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+        "rss_increase_mb": round((rss.peak - baseline) / 2 ** 20, 1),
+    }
+
+# Helper function to describe the environment of a run (so result files can be compared fairly)
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "opencv": cv2.__version__,
+            "numpy": np.__version__, "platform": platform.platform(), "cpus": psutil.cpu_count()}
+
+# Helper function to print the change of every result against an earlier result file
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["pipeline"], r["mode"], r["resolution"]): r for r in json.load(f)["results"]}
+    print(f"\nChange against {baseline_path} (new / old):")
+    for result in results:
+        old = baseline.get((result["pipeline"], result["mode"], result["resolution"]))
+        if old is None or "p50_ms" not in old or "p50_ms" not in result:
+            continue
+        print(f"{result['pipeline']:>24} {result['mode']:>10} {result['resolution']:>10}  "
+              f"p50 x{result['p50_ms'] / old['p50_ms']:.2f}  p95 x{result['p95_ms'] / old['p95_ms']:.2f}  "
+              f"throughput x{result['throughput_fps'] / old['throughput_fps']:.2f}")
+
+# Helper function to benchmark one pipeline at one resolution in a fresh process, so its peak RSS
+# isn't inflated by the models earlier pipelines left loaded (TensorFlow is never unloaded)
+# The child gets the same options (the later --pipelines/--resolutions/--output override them)
+def run_isolated(pipeline, resolution, modes):
+    fd, output = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        subprocess.run([sys.executable, os.path.abspath(__file__)] + sys.argv[1:] +
+                       ["--pipelines", pipeline, "--resolutions", resolution, "--output", output, "--child"],
+                       check=True)
+        with open(output, encoding="utf-8") as f:
+            return json.load(f)["results"]
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        print(f"{pipeline:>24} {'':>10} {resolution:>10} failed: {e}")
+        return [{"pipeline": pipeline, "mode": mode, "resolution": resolution, "skipped": str(e)}
+                for mode in modes]
+    finally:
+        os.remove(output)
+
+# Helper function to run every requested pipeline, mode and resolution in this process
+def run(args):
+    args.ring = SharedFrameRing() if args.shared_memory else None
+    process = psutil.Process()
+    results = []
+    for resolution in args.resolutions:
+        width, height = (int(v) for v in resolution.lower().split("x"))
+        count = args.frames + args.warmup + 1
+        if args.video:
+            frames, boxes = recorded_frames(args.video, width, height, count, args.objects)
+        else:
+            frames, boxes = synthetic_frames(width, height, count, objects=args.objects)
+        if args.static:
+            frames = [frames[0]] * count
+        for pipeline in args.pipelines:
+            for mode in args.modes:
+                result = {"pipeline": pipeline, "mode": mode, "resolution": resolution}
+                try:
+                    baseline = process.memory_info().rss
+                    build = inprocess_runner if mode == "inprocess" else http_runner
+                    runner = build(pipeline, frames[0], boxes, args)
+                    result.update(measure(runner, frames[1:], args.warmup, baseline))
+                    print(f"{pipeline:>24} {mode:>10} {resolution:>10} {result['throughput_fps']:>8.1f} "
+                          f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                          f"{result['peak_rss_mb']:>8.1f} {result['rss_increase_mb']:>8.1f}")
+                except Exception as e:
+                    result["skipped"] = str(e) # e.g. FaceNet isn't installed
+                    print(f"{pipeline:>24} {mode:>10} {resolution:>10} skipped: {e}")
+                results.append(result)
+    if args.ring is not None:
+        args.ring.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline in-process and through the Flask endpoints")
+    parser.add_argument("--pipelines", nargs="+", choices=PIPELINES, default=list(PIPELINES))
+    parser.add_argument("--modes", nargs="+", choices=["inprocess", "http"], default=["inprocess", "http"])
+    parser.add_argument("--resolutions", nargs="+", default=["640x360", "1280x720"], help="WIDTHxHEIGHT")
+    parser.add_argument("--frames", type=int, default=100, help="measured frames per run")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--video", help="use frames of a recorded video instead of synthetic frames")
+    parser.add_argument("--feature-mode", choices=["full", "hierarchical"], default="full")
+    parser.add_argument("--objects", type=int, default=3, help="objects tracked by multi_object_tracking")
+    parser.add_argument("--url", help="benchmark a running inference server instead of an in-process test client")
+    parser.add_argument("--json-transport", action="store_true", help="send base64 JSON instead of binary JPEG")
+    parser.add_argument("--shared-memory", action="store_true", help="pass raw frames through shared memory")
+    parser.add_argument("--static", action="store_true", help="repeat the first frame (a static scene)")
+    parser.add_argument("--no-scene-cache", action="store_true",
+                        help="recompute static scenes in the endpoints instead of reusing the last result")
+    parser.add_argument("--same-process", action="store_true",
+                        help="run every pipeline in this process (peak RSS then includes the models of earlier runs)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.no_scene_cache:
+        scene_cache.enabled = False
+
+    if not args.child:
+        print(f"{'pipeline':>24} {'mode':>10} {'resolution':>10} {'fps':>8} {'p50':>8} {'p95':>8} {'p99':>8} "
+              f"{'rss MB':>8} {'+rss MB':>8}")
+    if args.same_process or args.child:
+        results = run(args)
+    else:
+        results = []
+        for resolution in args.resolutions:
+            for pipeline in args.pipelines:
+                results += run_isolated(pipeline, resolution, args.modes)
+
+    report = {"environment": environment(), "frames": args.frames, "source": args.video or "synthetic",
+              "feature_mode": args.feature_mode, "objects": args.objects, "static": args.static,
+              "scene_cache": not args.no_scene_cache, "same_process": args.same_process,
+              "transport": "shared_memory" if args.shared_memory else "json" if args.json_transport else "binary",
+              "results": results}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    if args.child:
+        return
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
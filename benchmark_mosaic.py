@@ -0,0 +1,51 @@
+import argparse
+import time
+import numpy as np
+from face_mosaic import apply_mosaic, mosaic_faces, MOSAIC_METHODS
+
+# Helper function to create a random frame and random face boxes
+def make_case(num_faces, width, height, rng):
+    frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    boxes = []
+    for _ in range(num_faces):
+        size = int(rng.integers(24, 120))
+        x = int(rng.integers(0, width - size))
+        y = int(rng.integers(0, height - size))
+        boxes.append([x, y, size, size])
+    return frame, boxes
+
+# Helper function to get the median time (ms) of a function over several runs
+def time_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+# Helper function for the original implementation: one face at a time
+def per_face(frame, boxes, block_size):
+    for (x, y, w, h) in boxes:
+        frame = apply_mosaic(frame, x, y, w, h, level=block_size)
+    return frame
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the per-face mosaic with mosaic_faces (pixelate, blur, fill)")
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--block-size", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'faces':>5} {'per-face':>10} " + " ".join(f"{method:>10}" for method in MOSAIC_METHODS) + "  (median ms)")
+    for num_faces in args.faces:
+        frame, boxes = make_case(num_faces, args.width, args.height, rng)
+        row = [time_ms(lambda: per_face(frame.copy(), boxes, args.block_size), args.repeat)]
+        for method in MOSAIC_METHODS:
+            row.append(time_ms(lambda: mosaic_faces(frame.copy(), boxes, method, args.block_size), args.repeat))
+        print(f"{num_faces:>5} " + " ".join(f"{value:>10.3f}" for value in row))
+
+if __name__ == "__main__":
+    main()
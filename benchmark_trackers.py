@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import time
+import cv2
+import numpy as np
+from benchmark import environment, synthetic_clip
+from tracking_engine import ADAPTIVE, TRACKERS, TrackingEngine
+
+# Trackers measured by default (TLD and Boosting are too slow for live video)
+DEFAULT_TRACKERS = ("csrt", "kcf", "mosse", "mil", "medianflow")
+
+# Tracker whose trajectory is used as the reference on clips without ground truth
+REFERENCE_TRACKER = "csrt"
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(x2 - x1, 0) * max(y2 - y1, 0)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+# Helper function to read the frames of a recorded clip
+def read_clip(path, max_frames):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if len(frames) < 2:
+        raise RuntimeError(f"Cannot read frames from {path}")
+    return frames
+
+# Helper function to read a ground truth file: one x,y,w,h box per frame (comma, tab or space separated,
+# as in the OTB benchmark's groundtruth_rect.txt)
+def read_ground_truth(path):
+    with open(path, encoding="utf-8") as f:
+        return [[int(float(v)) for v in line.replace(",", " ").split()[:4]] for line in f if line.strip()]
+
+# Helper function to track the first box through the clip, returns the box of every frame (None when lost)
+# and the update time of every frame
+def track(kind, frames, box):
+    engine = TrackingEngine(max_lost=None, tracker=kind)
+    engine.add(frames[0], box)
+    boxes, times = [list(box)], []
+    for frame in frames[1:]:
+        start = time.perf_counter()
+        result = engine.update(frame)[0]
+        times.append(time.perf_counter() - start)
+        boxes.append(result["box"] if result["success"] else None)
+    return boxes, times, engine.kind
+
+# Helper function to summarize one run: speed, accuracy and drift (IoU at the start minus at the end)
+def summarize(boxes, times, truth):
+    ious = [iou(box, gt) if box is not None else 0.0 for box, gt in zip(boxes[1:], truth[1:])]
+    tenth = max(len(ious) // 10, 1)
+    first, last = float(np.mean(ious[:tenth])), float(np.mean(ious[-tenth:]))
+    return {
+        "frames": len(times),
+        "fps": round(len(times) / sum(times), 1),
+        "mean_update_ms": round(float(np.mean(times)) * 1000, 3),
+        "mean_iou": round(float(np.mean(ious)), 3),
+        "iou_first": round(first, 3),
+        "iou_last": round(last, 3),
+        "drift": round(first - last, 3),
+        "lost_frames": sum(box is None for box in boxes),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the speed and accuracy of the tracking algorithms")
+    parser.add_argument("--trackers", nargs="+", choices=list(TRACKERS) + [ADAPTIVE], default=list(DEFAULT_TRACKERS))
+    parser.add_argument("--video", action="append", default=[],
+                        help="recorded clip (repeatable); ground truth is read from the clip's .txt file if present")
+    parser.add_argument("--roi", help="x,y,w,h of the object in the first frame of clips without ground truth "
+                                      f"(drift is then measured against {REFERENCE_TRACKER})")
+    parser.add_argument("--frames", type=int, default=300, help="frames per clip")
+    parser.add_argument("--output", default="tracker_benchmark.json")
+    args = parser.parse_args()
+
+    # Clips: (name, frames, ground truth, reference); synthetic clip with exact ground truth by default
+    clips = []
+    for path in args.video:
+        frames = read_clip(path, args.frames)
+        truth_path = os.path.splitext(path)[0] + ".txt"
+        if os.path.exists(truth_path):
+            clips.append((path, frames, read_ground_truth(truth_path)[:len(frames)], "ground truth"))
+        elif args.roi:
+            box = [int(v) for v in args.roi.split(",")]
+            reference, _, _ = track(REFERENCE_TRACKER, frames, box)
+            truth = [b if b is not None else [0, 0, 0, 0] for b in reference]
+            clips.append((path, frames, truth, REFERENCE_TRACKER))
+        else:
+            raise SystemExit(f"{path}: no ground truth file ({truth_path}), give --roi")
+    if not clips:
+        frames, truth = synthetic_clip(640, 360, args.frames, objects=1)
+        clips.append(("synthetic", frames, [boxes[0] for boxes in truth], "ground truth"))
+
+    results = []
+    print(f"{'clip':>24} {'tracker':>10} {'fps':>8} {'ms':>8} {'IoU':>6} {'first':>6} {'last':>6} {'drift':>6} {'lost':>5}")
+    for name, frames, truth, reference in clips:
+        frames = frames[:len(truth)]
+        for kind in args.trackers:
+            result = {"clip": name, "tracker": kind, "reference": reference}
+            try:
+                boxes, times, final_kind = track(kind, frames, truth[0])
+                result.update(summarize(boxes, times, truth))
+                if kind == ADAPTIVE:
+                    result["final_tracker"] = final_kind
+                print(f"{os.path.basename(name)[-24:]:>24} {kind:>10} {result['fps']:>8.1f} "
+                      f"{result['mean_update_ms']:>8.2f} {result['mean_iou']:>6.2f} {result['iou_first']:>6.2f} "
+                      f"{result['iou_last']:>6.2f} {result['drift']:>6.2f} {result['lost_frames']:>5}")
+            except (cv2.error, AttributeError) as e:
+                result["skipped"] = str(e) # e.g. a tracker missing from this OpenCV build
+                print(f"{os.path.basename(name)[-24:]:>24} {kind:>10} skipped: {e}")
+            results.append(result)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,138 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, request, jsonify
 import cv2
-import numpy as np
-import base64
+from frame_transport import decode_request, make_response
+from model_registry import cascades, status_bp
+from scene_cache import SceneCache, stream_key
+import metrics
+import serving
 
-app = Flask(__name__)
+# Routes of this pipeline (also served by inference_server.py)
+bp = Blueprint("detect_features", __name__)
 
-# Helper function to detect features (eyes, nose, mouth)
-def detect_features(frame):
-    eye_cascade = cv2.CascadeClassifier("haarcascade_eye.xml")
-    mouth_cascade = cv2.CascadeClassifier("haarcascade_mcs_mouth.xml")
-    nose_cascade = cv2.CascadeClassifier("haarcascade_mcs_nose.xml")
+# Load the feature (and face, for the hierarchical mode) cascades once at startup
+cascades.load("face", "eye", "mouth", "nose")
+
+# Last features of each stream, reused while its scene doesn't change
+scene = SceneCache("detect_features")
+
+# Colors used to draw each feature (BGR)
+feature_colors = {
+    "eyes": (0, 255, 0), # Green for eyes
+    "mouths": (0, 0, 255), # Red for mouth
+    "noses": (255, 0, 0), # Blue for nose
+}
+
+# Regions of a face box (fractions of x, y, w, h) searched for each feature
+face_regions = {
+    "eyes": (0.0, 0.0, 1.0, 0.55), # Upper half
+    "noses": (0.15, 0.3, 0.7, 0.5), # Middle band
+    "mouths": (0.1, 0.6, 0.8, 0.4), # Lower part
+}
 
-    gray = cv2.medianBlur(frame, 1) # Remove noise
+# Smallest/largest feature size as fractions of the face width
+feature_scales = {
+    "eyes": (0.12, 0.45),
+    "noses": (0.15, 0.5),
+    "mouths": (0.2, 0.7),
+}
+
+# Cascade used for each feature
+feature_cascades = {"eyes": "eye", "noses": "nose", "mouths": "mouth"}
+
+# Helper function to turn the frame into the grayscale image searched by the cascades
+def preprocess(frame):
     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    gray = cv2.medianBlur(gray, 5) # Further noise removal
+    gray = cv2.medianBlur(gray, 5) # Noise removal
+    return gray
+
+# Helper function to find features (eyes, nose, mouth) without drawing them
+def find_features(frame):
+    gray = preprocess(frame)
+
+    # Eye, mouth and nose detection
+    with cascades.acquire("eye") as eye_cascade, metrics.timer("detect_multiscale:eye"):
+        eyes = eye_cascade.detectMultiScale(gray)
+    with cascades.acquire("mouth") as mouth_cascade, metrics.timer("detect_multiscale:mouth"):
+        mouths = mouth_cascade.detectMultiScale(gray)
+    with cascades.acquire("nose") as nose_cascade, metrics.timer("detect_multiscale:nose"):
+        noses = nose_cascade.detectMultiScale(gray)
+
+    return {
+        "eyes": [list(box) for box in eyes],
+        "mouths": [list(box) for box in mouths],
+        "noses": [list(box) for box in noses],
+    }
 
-    # Eye detection
-    eyes = eye_cascade.detectMultiScale(gray)
-    for (x, y, w, h) in eyes:
-        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2) # Green for eyes
+# Helper function to find features only inside detected faces, grouped per face
+def find_features_in_faces(frame):
+    gray = preprocess(frame)
+    with cascades.acquire("face") as face_cascade, metrics.timer("detect_multiscale:face"):
+        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(48, 48))
 
-    # Mouth detection
-    mouths = mouth_cascade.detectMultiScale(gray)
-    for (x, y, w, h) in mouths:
-        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 0, 255), 2) # Red for mouth
+    features = {"faces": [], "eyes": [], "mouths": [], "noses": []}
+    for (fx, fy, fw, fh) in faces:
+        face = {"box": [fx, fy, fw, fh]}
+        for name, (rx, ry, rw, rh) in face_regions.items():
+            # Crop the part of the face where this feature can be
+            x0, y0 = fx + int(rx * fw), fy + int(ry * fh)
+            roi = gray[y0: y0 + int(rh * fh), x0: x0 + int(rw * fw)]
 
-    # Nose detection
-    noses = nose_cascade.detectMultiScale(gray)
-    for (x, y, w, h) in noses:
-        cv2.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2) # Blue for nose    
+            # Only search sizes that make sense for this face
+            min_scale, max_scale = feature_scales[name]
+            min_size = max(int(min_scale * fw), 8)
+            max_size = max(int(max_scale * fw), min_size + 1)
+            with cascades.acquire(feature_cascades[name]) as cascade:
+                with metrics.timer(f"detect_multiscale:{feature_cascades[name]}_in_face"):
+                    boxes = cascade.detectMultiScale(roi, scaleFactor=1.1, minNeighbors=4,
+                                                     minSize=(min_size, min_size // 2),
+                                                     maxSize=(max_size, max_size))
 
+            # Map the boxes back to frame coordinates
+            face[name] = [[x0 + x, y0 + y, w, h] for (x, y, w, h) in boxes]
+            features[name] += face[name]
+        features["faces"].append(face)
+
+    return features
+
+# Helper function to draw detected features on the frame
+def draw_features(frame, features):
+    for name, color in feature_colors.items():
+        for (x, y, w, h) in features.get(name, []):
+            cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
     return frame
 
+# Helper function to detect features (eyes, nose, mouth)
+def detect_features(frame):
+    return draw_features(frame, find_features(frame))
+
 # API route to handle feature detection
-@app.route("/detect_features", methods=["POST"])
+@bp.route("/detect_features", methods=["POST"])
 
 def detect():
     try:
-        # Decode the frame sent from the frontend
-        data = request.json
-        frame_str = data["frame"]
-        frame_data = base64.b64decode(frame_str)
-        nparr = np.frombuffer(frame_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)    
-        frame = detect_features(frame)
+        # Decode the frame sent from the frontend (JSON/base64 or binary)
+        frame_request = decode_request(request)
 
-        # Encode the frame to send back to the frontend
-        _, buffer = cv2.imencode(".jpg", frame)
-        frame_str = base64.b64encode(buffer).decode("utf-8")
+        # "hierarchical" searches features inside detected faces only, "full" searches the whole frame
+        mode = frame_request.meta.get("mode", "full")
+        find = find_features_in_faces if mode == "hierarchical" else find_features
+        features = scene.get(stream_key(frame_request.meta, mode), frame_request.frame,
+                             lambda: find(frame_request.frame))
+        if frame_request.annotations_only:
+            return make_response(frame_request, features)
+
+        frame = draw_features(frame_request.frame, features)
 
-        return jsonify({"frame": frame_str})
+        # Encode the frame to send back to the frontend
+        return make_response(frame_request, features, frame)
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"error": str(e)}), 500       
 
+# Standalone server for this pipeline only
+app = Flask(__name__)
+app.register_blueprint(bp)
+app.register_blueprint(status_bp)
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5002)    
\ No newline at end of file
+    serving.main(app, 5002, "Facial feature detection backend")
\ No newline at end of file
@@ -1,37 +1,142 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, request, jsonify
+import queue
+import threading
+import time
+from concurrent.futures import Future
 import cv2
 import numpy as np
-import base64
 from numpy import linalg as LA
-import subprocess
-import sys
+from frame_transport import decode_request, make_response
+from face_gallery import FaceGallery
+from session_store import SessionStore, UnknownSession, UNKNOWN_SESSION_ERROR
+from model_registry import models, ModelNotReady, status_bp
+from scene_cache import SceneCache, stream_key
+import metrics
+import serving
 
-# Ensure the "keras-facenet" module is installed
-try:
-    from keras_facenet import FaceNet
-except ImportError:
-    print("keras_facenet isn't installed, installed...")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "keras-facenet"])
-    from keras_facenet import FaceNet
+# Routes of this pipeline (also served by inference_server.py)
+bp = Blueprint("face_detection", __name__)
 
-app = Flask(__name__)
+# Helper function to load the pre-trained FaceNet model (MTCNN is loaded by the warm-up)
+def load_facenet():
+    try:
+        from keras_facenet import FaceNet
+    except ImportError:
+        raise RuntimeError("keras_facenet isn't installed, run: pip install -r requirements.txt")
+    return FaceNet()
+
+# Helper function to run a first detection and embedding on synthetic images, so the
+# first real request doesn't pay for building MTCNN and compiling the TensorFlow graphs
+def warm_up_facenet(embedder):
+    embedder.crop(np.zeros((360, 640, 3), dtype=np.uint8))
+    embedder.embeddings([np.zeros((160, 160, 3), dtype=np.uint8)])
+
+# Load FaceNet in the background so the server answers /health and /ready right away
+models.register("facenet", load_facenet, warm_up_facenet)
+
+# Server-side gallery of enrolled identities (stored in the "face_gallery" folder)
+gallery = FaceGallery("face_gallery")
+
+# Largest number of face crops embedded in one forward pass, and how long (ms) the first
+# waiting request may be held back so crops of concurrent requests can join its batch
+MAX_BATCH_SIZE = 32
+MAX_BATCH_WAIT_MS = 5
+
+# Dynamic batching of FaceNet embeddings: request threads queue their face crops, one worker
+# thread runs a single forward pass for everything queued within the window and fans the rows back out
+class EmbeddingBatcher:
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    # Embeddings of the crops of one request (blocks until its batch has run)
+    def embed(self, embedder, crops):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        future = Future()
+        self.requests.put((embedder, list(crops), future))
+        return future.result()
+
+    # Collect requests until the batch is full or the first one has waited max_wait
+    # (a request that would overflow the batch is kept for the next one)
+    def collect(self, pending):
+        batch = [pending or self.requests.get()]
+        size = len(batch[0][1])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(item[1]) > self.max_batch_size:
+                return batch, item
+            batch.append(item)
+            size += len(item[1])
+        return batch, None
+
+    def run(self):
+        pending = None
+        while True:
+            batch, pending = self.collect(pending)
+            crops = [crop for _, request_crops, _ in batch for crop in request_crops]
+            try:
+                with metrics.timer("facenet_embed"):
+                    embeddings = batch[0][0].embeddings(crops) # One forward pass for every queued face
+                metrics.set_gauge("embedding_batch_size", len(crops))
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for _, request_crops, future in batch:
+                future.set_result(embeddings[start:start + len(request_crops)])
+                start += len(request_crops)
+
+batcher = EmbeddingBatcher()
 
-# Initialize the pre-trained FaceNet model
-embedder = FaceNet()
+# Matching state of one client: the reference face stays on the server
+class FaceSession:
+    def __init__(self):
+        self.reference_embedding = None
 
-# Helper function to preprocess images and generate face embeddings
+# Sessions issued on initialize
+sessions = SessionStore(FaceSession)
+
+# Last faces and embeddings of each stream, reused while its scene doesn't change
+scene = SceneCache("face_detection")
+
+# Helper function to detect every face and embed all of them in one batched model call
+def get_all_face_embeddings(frame, threshold=0.95):
+    embedder = models.get("facenet") # Raises ModelNotReady while FaceNet is loading
+
+    # Detect faces and crop them from the image
+    with metrics.timer("mtcnn_detect"):
+        detections, crops = embedder.crop(frame, threshold=threshold)
+    if not detections:
+        return np.zeros((0, 0), dtype=np.float32), []
+
+    # Embeddings of all face crops, shape (number of faces, embedding size), computed in one
+    # forward pass together with the faces of concurrent requests
+    embeddings = batcher.embed(embedder, crops)
+    # Get bounding boxes to display on the frame
+    bboxes = [[int(v) for v in detection["box"]] for detection in detections]
+
+    return embeddings, bboxes
+
+# Helper function to preprocess images and generate the embedding of the first face
 def get_face_embeddings(frame):
-    # Detect faces and extract embeddings from the images
-    results = embedder.extract(frame, threshold=0.95)
-    if len(results) == 0:
+    embeddings, bboxes = get_all_face_embeddings(frame)
+    if len(bboxes) == 0:
         raise ValueError(f"No face detected.")
-    
-    # Get the embedding vector
-    embeddings = results[0]["embedding"]
-    # Get bounding box to display on the frame
-    bbox = results[0]["box"]  
-
-    return embeddings, bbox
+    return embeddings[0], bboxes[0]
 
 # Helper function to compare two face embeddings
 def compare_faces(embedding1, embedding2, threshold=0.7):
@@ -43,52 +148,140 @@ def compare_faces(embedding1, embedding2, threshold=0.7):
 
     return matched, distance 
 
+# Helper function to compare many face embeddings (one per row) with one reference at once
+def compare_all_faces(embeddings, reference_embedding, threshold=0.7):
+    distances = LA.norm(embeddings - reference_embedding, axis=1)
+    return distances < threshold, distances
+
 # API route to handle real-time face detection and matching
-@app.route("/detect_face", methods=["POST"])
+@bp.route("/detect_face", methods=["POST"])
 
 def detect_face():
     try:
-        # Decode the frame sent from the frontend
-        data = request.json
-        frame_str = data["frame"]
-        reference_embedding = data.get("reference_embedding", None)
-        frame_data = base64.b64decode(frame_str)
-        nparr = np.frombuffer(frame_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Decode the frame sent from the frontend (JSON/base64 or binary)
+        frame_request = decode_request(request)
+        meta = frame_request.meta
+
+        # The reference comes from the client's session, or (older clients) from the request itself
+        if "session_id" in meta:
+            reference_embedding = sessions.get(meta["session_id"]).reference_embedding
+        else:
+            reference_embedding = meta.get("reference_embedding", None)
 
         # Convert the frame from BGR to RGB
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        embeddings,_ = get_face_embeddings(frame)
-        if embeddings is None:
-            return jsonify({"message": "No face detected."}), 400
+        frame = cv2.cvtColor(frame_request.frame, cv2.COLOR_BGR2RGB)
         
-        if reference_embedding is None:
+        # Embeddings of every face in the frame, computed in one batch (reused while the scene is static,
+        # the matching below always runs against the current reference and gallery)
+        embeddings, bboxes = scene.get(stream_key(meta), frame, lambda: get_all_face_embeddings(frame))
+        if len(bboxes) == 0:
+            response = {"message": "No face detected.", "faces": []}
+        elif meta.get("mode") == "initialize":
+            # Keep the first detected face as the reference of a new session
+            session_id, session = sessions.create()
+            session.reference_embedding = embeddings[0]
+            response = {
+                "message": "Reference face set.",
+                "session_id": session_id,
+                "box": bboxes[0],
+                "faces": [{"box": bbox} for bbox in bboxes]
+            }
+        elif meta.get("mode") == "identify":
+            # Match every detected face against every enrolled identity
+            all_matches = gallery.match(embeddings, top_k=int(meta.get("top_k", 3)))
+            faces = []
+            for bbox, matches in zip(bboxes, all_matches):
+                best = matches[0] if matches and matches[0]["matched"] else None
+                faces.append({"box": bbox, "name": best["name"] if best else None, "matches": matches})
+            names = [face["name"] for face in faces if face["name"]]
+            response = {
+                "message": f"Identified: {', '.join(names)}" if names else "Unknown face.",
+                "matches": all_matches[0], # First face, kept for older clients
+                "box": bboxes[0],
+                "faces": faces
+            }
+        elif reference_embedding is None:
             # Set the first detected face as the reference
-            reference_embedding = embeddings.tolist() # Convert to list to make it JSON serializable
+            reference_embedding = embeddings[0].tolist() # Convert to list to make it JSON serializable
             response = {
                 "message": "Reference face set.",
-                "reference_embedding": reference_embedding
+                "reference_embedding": reference_embedding,
+                "box": bboxes[0],
+                "faces": [{"box": bbox} for bbox in bboxes]
             }
         else:
-            # Compare the detected face with the reference
+            # Compare every detected face with the reference
             reference_embedding = np.array(reference_embedding) # Convert back to numpy array
-            matched, distance = compare_faces(embeddings, reference_embedding)
+            matched, distances = compare_all_faces(embeddings, reference_embedding)
 
-            if matched:
+            if matched.any():
                 message = "Faces matched!"
             else:
                 message = "Faces not matched!"           
+            best = int(np.argmin(distances))
             response = {
                 "message": message,
-                "distance": distance
+                "distance": distances[best], # Closest face to the reference
+                "box": bboxes[best],
+                "faces": [{"box": bbox, "matched": m, "distance": d}
+                          for bbox, m, d in zip(bboxes, matched, distances)]
             }
 
-        return jsonify(response)
+        # Face matching never sends a frame back, only the results
+        return make_response(frame_request, response)
 
+    except UnknownSession:
+        return jsonify({"error": UNKNOWN_SESSION_ERROR}), 404
+    except ModelNotReady as e:
+        if e.failed: # FaceNet won't load (e.g. keras_facenet isn't installed): report it, don't say "loading"
+            return jsonify({"error": str(e), "failed": True}), 500
+        return jsonify({"error": str(e), "loading": True}), 503
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"error": str(e)}), 500   
+
+# API route to enroll the face of a frame into the gallery under a name
+@bp.route("/gallery/enroll", methods=["POST"])
+
+def enroll_face():
+    try:
+        frame_request = decode_request(request)
+        name = frame_request.meta.get("name")
+        if not name:
+            return jsonify({"error": "A name is required."}), 400
+
+        frame = cv2.cvtColor(frame_request.frame, cv2.COLOR_BGR2RGB)
+        embeddings, bbox = get_face_embeddings(frame)
+        gallery.enroll(name, embeddings)
+        return jsonify({"message": f"{name} enrolled.", "box": [int(v) for v in bbox], "size": len(gallery)})
+    except ModelNotReady as e:
+        if e.failed: # FaceNet won't load (e.g. keras_facenet isn't installed): report it, don't say "loading"
+            return jsonify({"error": str(e), "failed": True}), 500
+        return jsonify({"error": str(e), "loading": True}), 503
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# API route to list the enrolled identities
+@bp.route("/gallery", methods=["GET"])
+
+def list_gallery():
+    return jsonify({"names": sorted(set(gallery.names)), "size": len(gallery)})
+
+# API route to remove an identity from the gallery
+@bp.route("/gallery/<name>", methods=["DELETE"])
+
+def remove_from_gallery(name):
+    removed = gallery.remove(name)
+    if not removed:
+        return jsonify({"error": f"{name} is not enrolled."}), 404
+    return jsonify({"message": f"{name} removed.", "removed": removed})
     
+
+# Standalone server for this pipeline only
+app = Flask(__name__)
+app.register_blueprint(bp)
+app.register_blueprint(status_bp)
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
+    serving.main(app, 5000, "Face detection backend")
\ No newline at end of file
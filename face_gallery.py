@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+import numpy as np
+
+# Helper function to compute the Euclidean distances between every query and every gallery embedding
+def pairwise_distances(queries, gallery):
+    # |a - b|^2 = |a|^2 + |b|^2 - 2ab, computed as one matrix product
+    squared = (np.sum(queries ** 2, axis=1)[:, None] + np.sum(gallery ** 2, axis=1)[None, :]
+               - 2.0 * queries @ gallery.T)
+    return np.sqrt(np.maximum(squared, 0.0))
+
+# Approximate index: embeddings are split into k-means clusters and only the closest clusters are searched
+class ClusterIndex:
+    def __init__(self, embeddings, num_clusters=None, iterations=10, seed=0):
+        num_clusters = num_clusters or max(int(np.sqrt(len(embeddings))), 1)
+        rng = np.random.default_rng(seed)
+        self.centroids = embeddings[rng.choice(len(embeddings), num_clusters, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmin(pairwise_distances(embeddings, self.centroids), axis=1)
+            for c in range(num_clusters):
+                members = embeddings[assignment == c]
+                if len(members):
+                    self.centroids[c] = members.mean(axis=0)
+        assignment = np.argmin(pairwise_distances(embeddings, self.centroids), axis=1)
+        self.lists = [np.flatnonzero(assignment == c) for c in range(num_clusters)]
+
+    # Indices of the gallery entries worth comparing against one query: the members of the num_probes
+    # closest clusters that have any (k-means can leave clusters empty)
+    def candidates(self, query, num_probes):
+        nearest = np.argsort(pairwise_distances(query[None, :], self.centroids)[0])
+        lists = [self.lists[c] for c in nearest if len(self.lists[c])][:num_probes]
+        return np.concatenate(lists) if lists else np.zeros(0, dtype=np.int64)
+
+# Named face embeddings stored on disk (names.json + embeddings.npy, memory-mapped when loaded)
+class FaceGallery:
+    def __init__(self, directory="face_gallery", approximate_threshold=5000, num_probes=4):
+        self.directory = directory
+        self.approximate_threshold = approximate_threshold # Gallery size from which the approximate index is used
+        self.num_probes = num_probes
+        self.lock = threading.Lock()
+        self.index = None
+        self.load()
+
+    @property
+    def names_path(self):
+        return os.path.join(self.directory, "names.json")
+
+    @property
+    def embeddings_path(self):
+        return os.path.join(self.directory, "embeddings.npy")
+
+    def load(self):
+        if os.path.exists(self.names_path) and os.path.exists(self.embeddings_path):
+            with open(self.names_path, encoding="utf-8") as f:
+                self.names = json.load(f)
+            self.embeddings = np.load(self.embeddings_path, mmap_mode="r")
+        else:
+            self.names = []
+            self.embeddings = np.zeros((0, 0), dtype=np.float32)
+
+    # Write to temporary files first so a crash never leaves a half written gallery
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.embeddings = np.array(self.embeddings, dtype=np.float32) # Drop the memory map before replacing the file
+        tmp_embeddings = self.embeddings_path + ".tmp.npy"
+        tmp_names = self.names_path + ".tmp"
+        np.save(tmp_embeddings, self.embeddings)
+        with open(tmp_names, "w", encoding="utf-8") as f:
+            json.dump(self.names, f, ensure_ascii=False)
+        os.replace(tmp_embeddings, self.embeddings_path)
+        os.replace(tmp_names, self.names_path)
+        self.embeddings = np.load(self.embeddings_path, mmap_mode="r")
+
+    def __len__(self):
+        return len(self.names)
+
+    # Add one embedding for a name (a name can have several embeddings)
+    def enroll(self, name, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        with self.lock:
+            if len(self.names) and embedding.shape[1] != self.embeddings.shape[1]:
+                raise ValueError("Embedding size does not match the gallery.")
+            self.embeddings = np.concatenate([self.embeddings, embedding]) if len(self.names) else embedding
+            self.names.append(name)
+            self.index = None
+            self.save()
+
+    # Remove every embedding of a name, returns how many were removed
+    def remove(self, name):
+        with self.lock:
+            keep = [i for i, n in enumerate(self.names) if n != name]
+            removed = len(self.names) - len(keep)
+            if removed:
+                self.embeddings = np.asarray(self.embeddings)[keep].reshape(len(keep), -1)
+                self.names = [self.names[i] for i in keep]
+                self.index = None
+                self.save()
+            return removed
+
+    # Top-k gallery identities for each query embedding: [[{"name", "distance", "matched"}, ...], ...]
+    def match(self, queries, top_k=3, threshold=0.7, approximate=None):
+        queries = np.asarray(queries, dtype=np.float32)
+        if not len(queries):
+            return []
+        queries = queries.reshape(len(queries), -1)
+        with self.lock:
+            if not self.names:
+                return [[] for _ in range(len(queries))]
+            gallery = np.asarray(self.embeddings)
+            if approximate is None:
+                approximate = len(self.names) >= self.approximate_threshold
+            if approximate and self.index is None:
+                self.index = ClusterIndex(gallery)
+            index = self.index if approximate else None
+
+            results = []
+            if index is None:
+                # Exact search: one matrix of query x gallery distances
+                distances = pairwise_distances(queries, gallery)
+                candidates = [np.arange(len(gallery))] * len(queries)
+            else:
+                candidates = [index.candidates(query, self.num_probes) for query in queries]
+                # No candidate at all (can't happen with a non-empty gallery): search everything
+                candidates = [c if len(c) else np.arange(len(gallery)) for c in candidates]
+                distances = [pairwise_distances(query[None, :], gallery[c])[0] for query, c in zip(queries, candidates)]
+
+            for row, candidate in zip(distances, candidates):
+                # A name can have several embeddings: look a bit deeper than k and keep each name once
+                depth = min(top_k * 4, len(row))
+                nearest = np.argpartition(row, depth - 1)[:depth]
+                matches, seen = [], set()
+                for i in nearest[np.argsort(row[nearest])]:
+                    name = self.names[candidate[i]]
+                    if name in seen:
+                        continue
+                    seen.add(name)
+                    matches.append({"name": name, "distance": float(row[i]), "matched": bool(row[i] < threshold)})
+                    if len(matches) == top_k:
+                        break
+                results.append(matches)
+            return results
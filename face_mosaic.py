@@ -1,48 +1,171 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, request, jsonify
+import threading
 import cv2
 import numpy as np
-import base64
+from frame_transport import decode_request, make_response
+from mosaic import apply_mosaic, clamp_box, mosaic_faces, MOSAIC_METHODS
+from model_registry import cascades, status_bp
+from session_store import SessionStore, UnknownSession, UNKNOWN_SESSION_ERROR
+from scene_cache import SceneCache, stream_key
+import metrics
+import serving
 
-app = Flask(__name__)
+# Routes of this pipeline (also served by inference_server.py)
+bp = Blueprint("face_mosaic", __name__)
+
+# Load the face cascade once at startup
+cascades.load("face")
+
+# Helper function to run full face detection on a grayscale frame
+def detect_faces(gray):
+    with cascades.acquire("face") as face_cascade, metrics.timer("detect_multiscale:face"):
+        faces = face_cascade.detectMultiScale(gray)
+    return [[int(v) for v in face] for face in faces]
+
+# Runs full detection every few frames and moves the face boxes with optical flow in between
+class FacePropagator:
+    def __init__(self, detect_interval=5, min_points=4, padding=0.1):
+        self.detect_interval = detect_interval # Max frames between two full detections
+        self.min_points = min_points # Fewer tracked points than this on a face forces a detection
+        self.padding = padding # Grow propagated boxes a little to absorb drift
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.prev_gray = None
+        self.boxes = []
+        self.points = None # Tracked corner points, shape (N, 1, 2)
+        self.owners = None # Index of the box each point belongs to
+        self.frames_since_detection = 0
+
+    # Helper function to pick corners inside each face box to follow with optical flow
+    def select_points(self, gray):
+        points, owners = [], []
+        for i, (x, y, w, h) in enumerate(self.boxes):
+            mask = np.zeros_like(gray)
+            mask[y: y + h, x: x + w] = 255
+            corners = cv2.goodFeaturesToTrack(gray, maxCorners=30, qualityLevel=0.01, minDistance=5, mask=mask)
+            if corners is not None:
+                points.append(corners)
+                owners += [i] * len(corners)
+        self.points = np.concatenate(points).astype(np.float32) if points else None
+        self.owners = np.array(owners)
+
+    # Helper function to move each box by the median motion of its points (None if a face was lost)
+    def propagate(self, gray):
+        if not self.boxes:
+            return [] # No face to follow until the next full detection
+        if self.points is None:
+            return None
+        with metrics.timer("optical_flow"):
+            new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, self.points, None,
+                                                              winSize=(15, 15), maxLevel=2)
+        good = status.ravel() == 1
+
+        boxes = []
+        for i, (x, y, w, h) in enumerate(self.boxes):
+            selected = good & (self.owners == i)
+            if np.count_nonzero(selected) < self.min_points:
+                return None # Confidence dropped on this face
+            dx, dy = np.median((new_points[selected] - self.points[selected]).reshape(-1, 2), axis=0)
+            boxes.append([int(round(x + dx)), int(round(y + dy)), w, h])
+
+        self.points = new_points[good]
+        self.owners = self.owners[good]
+        return boxes
+
+    # Face boxes for this frame and whether a full detection was run
+    def update(self, gray):
+        with self.lock:
+            if self.prev_gray is not None and self.prev_gray.shape != gray.shape:
+                self.reset()
 
-# Helper function to apply mosaic to a face region
-def apply_mosaic(frame, x, y, w, h, level=15):
-    mosaic = frame[y: y + h, x: x + w]
-    mh = int(h / level)
-    mw = int(w / level)
-    mosaic = cv2.resize(mosaic, (mw, mh), interpolation=cv2.INTER_LINEAR)
-    mosaic = cv2.resize(mosaic, (w, h), interpolation=cv2.INTER_NEAREST)
-    frame[y: y + h, x: x + w] = mosaic
-    return frame
+            boxes = None
+            if self.prev_gray is not None and self.frames_since_detection < self.detect_interval - 1:
+                boxes = self.propagate(gray)
+
+            detected = boxes is None
+            if detected:
+                self.boxes = detect_faces(gray)
+                self.select_points(gray)
+                self.frames_since_detection = 0
+            else:
+                self.boxes = boxes
+                self.frames_since_detection += 1
+            self.prev_gray = gray
+
+            # Grow propagated boxes a little to absorb drift, and keep them inside the frame
+            height, width = gray.shape[:2]
+            pad = 0 if detected else self.padding
+            boxes = [clamp_box([x - w * pad / 2, y - h * pad / 2, w * (1 + pad), h * (1 + pad)], width, height)
+                     for (x, y, w, h) in self.boxes]
+            return [box for box in boxes if box[2] > 0 and box[3] > 0], detected
+
+# Detect-then-track state per client session, plus a shared one for clients without a session id
+sessions = SessionStore(FacePropagator)
+propagator = FacePropagator()
+
+# Last face boxes of each stream, reused while its scene doesn't change (the mask is always reapplied)
+scene = SceneCache("face_mosaic")
 
 # API route to handle face mosaic
-@app.route("/apply_mosaic", methods=["POST"])
+# Response contract:
+# - by default the frame comes back with every detected face masked ("method", "block_size"),
+#   so a client that only displays the returned frame never shows an unmasked face
+# - with "response": "annotations" only the face boxes come back (no frame); masking is then up to
+#   the client, which holds the unmasked frame (app.py masks it with mosaic.mosaic_faces, or outlines
+#   the faces in its non-private MOSAIC_PREVIEW mode); "preview" is no longer read by the backend
+@bp.route("/apply_mosaic", methods=["POST"])
 
 def mosaic():
     try:
-        # Decode the frame sent from the frontend
-        data = request.json
-        frame_str = data["frame"]
-        frame_data = base64.b64decode(frame_str)
-        nparr = np.frombuffer(frame_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        face_cascade = cv2.CascadeClassifier("haarcascade_frontalface_default.xml")
+        # Decode the frame sent from the frontend (JSON/base64 or binary)
+        frame_request = decode_request(request)
+        frame = frame_request.frame
+
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray)
 
-        for (x, y, w, h) in faces:
-            frame = apply_mosaic(frame, x, y, w, h)
+        # "detect_interval" > 1 enables detect-then-track: full detection at most every N frames
+        detect_interval = int(frame_request.meta.get("detect_interval", 1))
+        session_id = None
+        if detect_interval > 1:
+            # "initialize" starts a new session so several clients keep separate face boxes
+            if frame_request.meta.get("mode") == "initialize":
+                session_id, session_propagator = sessions.create()
+            else:
+                session_propagator = sessions.resolve(frame_request.meta, propagator)
+            session_propagator.detect_interval = detect_interval
+            faces, detected = session_propagator.update(gray)
+        else:
+            # Full detection on every frame, unless the scene hasn't changed since the last detection
+            faces, detected = scene.get(stream_key(frame_request.meta), gray, lambda: detect_faces(gray)), True
 
-        # Encode the frame to send to the frontend
-        _, buffer = cv2.imencode(".jpg", frame)
-        frame_str = base64.b64encode(buffer).decode("utf-8")
+        results = {"faces": faces, "detected": detected}
+        if session_id is not None:
+            results["session_id"] = session_id
+        # Face boxes only: the client masks (or, in preview mode, outlines) the faces on its own
+        # full resolution frame
+        if frame_request.annotations_only:
+            return make_response(frame_request, results)
+
+        # All faces are anonymized in one pass ("pixelate", "blur" or "fill")
+        with metrics.timer("mosaic"):
+            frame = mosaic_faces(frame, faces, method=frame_request.meta.get("method", "pixelate"),
+                                 block_size=frame_request.meta.get("block_size", 15))
 
-        return jsonify({"frame": frame_str})
+        # Encode the frame to send to the frontend
+        return make_response(frame_request, results, frame)
+    except UnknownSession:
+        return jsonify({"error": UNKNOWN_SESSION_ERROR}), 404
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"error": str(e)}), 500        
 
+# Standalone server for this pipeline only
+app = Flask(__name__)
+app.register_blueprint(bp)
+app.register_blueprint(status_bp)
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5001)
+    serving.main(app, 5001, "Face mosaic backend")
 
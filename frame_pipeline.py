@@ -0,0 +1,200 @@
+import os
+import queue
+import sys
+import threading
+import time
+import cv2
+import metrics
+
+# Helper function to put an item into a bounded queue, dropping the oldest item when full
+def put_latest(q, item):
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait() # Drop the stale item
+            except queue.Empty:
+                pass
+
+# Helper function to open a video source: a camera index ("0"), a video file or a stream URL
+# Returns (capture, fps to pace the capture at), the fps is only set for video files, which
+# would otherwise be read much faster than real time
+def open_source(source):
+    source = str(source).strip()
+    if source.isdigit():
+        if sys.platform == "win32":
+            return cv2.VideoCapture(int(source), cv2.CAP_DSHOW), None
+        return cv2.VideoCapture(int(source)), None
+    cap = cv2.VideoCapture(source)
+    if os.path.isfile(source):
+        return cap, cap.get(cv2.CAP_PROP_FPS) or 30.0
+    return cap, None # Live stream: read frames as they arrive
+
+# Chooses how often frames are sent to the backend and at which resolution, from the measured
+# round-trip latency, so that the display keeps up with target_fps:
+# - with `workers` requests in flight and one frame sent every `interval` frames (the others are shown
+#   at once with the last results), the display runs at about workers * interval / latency fps
+# - when that is too slow the inference resolution is lowered first, then frames are skipped;
+#   with headroom, skipping is reduced first, then the resolution is raised again
+class AdaptiveController:
+    def __init__(self, target_fps=15, workers=1, max_width=640, scales=(1.0, 0.75, 0.5),
+                 max_interval=10, adjust_period=0.5):
+        self.target_fps = target_fps
+        self.workers = workers
+        self.max_width = max_width # Inference frames are never wider than this
+        self.scales = scales # Resolution steps (a single step keeps the resolution fixed, e.g. for trackers)
+        self.max_interval = max_interval # 1 never skips a frame (e.g. privacy mosaic)
+        self.adjust_period = adjust_period
+
+        self.scale_index = 0
+        self.interval = 1
+        self.latency = None # Smoothed round trip (seconds)
+        self.counter = 0
+        self.last_adjust = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Whether this frame should be sent (the others reuse the last results)
+    def should_send(self):
+        with self.lock:
+            self.counter += 1
+            if self.counter >= self.interval:
+                self.counter = 0
+                return True
+            return False
+
+    # Frame at the current inference resolution and its scale relative to the display frame
+    def resize(self, frame):
+        height, width = frame.shape[:2]
+        scale = min(self.max_width / width, 1.0) * self.scales[self.scale_index]
+        if scale == 1.0:
+            return frame, 1.0
+        size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA), scale
+
+    # Record the round trip of one request
+    def record(self, seconds):
+        with self.lock:
+            self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+            self.adjust()
+
+    # The backend was busy or unreachable: step down like a slow round trip
+    def overloaded(self):
+        with self.lock:
+            self.adjust(force_down=True)
+
+    def adjust(self, force_down=False):
+        now = time.monotonic()
+        if now - self.last_adjust < self.adjust_period or (self.latency is None and not force_down):
+            return
+        self.last_adjust = now
+        latency = max(self.latency or 0.0, 1e-3)
+        display_fps = self.workers * self.interval / latency
+        if force_down or display_fps < 0.9 * self.target_fps:
+            if self.scale_index < len(self.scales) - 1:
+                self.scale_index += 1
+            elif self.interval < self.max_interval:
+                self.interval += 1
+        elif self.interval > 1 and self.workers * (self.interval - 1) / latency > 1.2 * self.target_fps:
+            self.interval -= 1
+        elif self.interval == 1 and self.scale_index > 0 and self.workers / latency > 1.5 * self.target_fps:
+            self.scale_index -= 1
+
+# Capture -> worker -> display pipeline for one video source
+# process(frame) runs on the worker threads and returns (display frame, results) or None to skip the frame
+class FramePipeline:
+    def __init__(self, cap, process, size=None, workers=1, pace_fps=None):
+        self.cap = cap
+        self.process = process
+        self.size = size
+        self.workers = workers
+        self.pace_fps = pace_fps # Read at most this many frames per second (video files)
+
+        # Bounded queues that only ever keep the newest items
+        self.captured = queue.Queue(maxsize=workers)
+        self.results = queue.Queue(maxsize=1)
+
+        self.running = False
+        self.threads = []
+        self.last_frame = None
+        self.last_seq = -1 # Sequence number of the last displayed result
+        self.lock = threading.Lock()
+
+        # Displayed frames per second, smoothed
+        self.fps = 0.0
+        self.last_display = None
+
+    def start(self):
+        self.running = True
+        self.threads = [threading.Thread(target=self.capture_loop, daemon=True)]
+        self.threads += [threading.Thread(target=self.worker_loop, daemon=True) for _ in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join(timeout=1)
+        self.cap.release()
+
+    # Capture stage: read frames as fast as the source delivers them
+    def capture_loop(self):
+        seq = 0
+        next_read = time.monotonic()
+        while self.running:
+            if self.pace_fps:
+                next_read += 1.0 / self.pace_fps
+                time.sleep(max(next_read - time.monotonic(), 0))
+            with metrics.timer("capture"):
+                ret, frame = self.cap.read()
+            if not ret:
+                print("Cannot receive frame")
+                self.running = False
+                break
+
+            # Reduce size to speed up
+            if self.size is not None:
+                frame = cv2.resize(frame, self.size)
+            with self.lock:
+                self.last_frame = frame
+            put_latest(self.captured, (seq, frame))
+            seq += 1
+
+    # Worker stage: talk to the backend for the newest captured frame
+    def worker_loop(self):
+        while self.running:
+            try:
+                seq, frame = self.captured.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                with metrics.timer("process"):
+                    output = self.process(frame.copy())
+            except Exception as e:
+                print(f"Processing failed: {e}")
+                continue
+            if output is not None:
+                put_latest(self.results, (seq, output))
+
+    # Display stage: newest ready (display frame, results), or None if nothing new
+    def latest(self):
+        try:
+            seq, output = self.results.get_nowait()
+        except queue.Empty:
+            return None
+        if seq < self.last_seq: # Finished after a newer frame was shown
+            return None
+        self.last_seq = seq
+
+        now = time.monotonic()
+        if self.last_display is not None:
+            self.fps = 0.9 * self.fps + 0.1 / max(now - self.last_display, 1e-6)
+        self.last_display = now
+        return output
+
+    # Copy of the most recently captured frame (e.g. for ROI selection)
+    def latest_frame(self):
+        with self.lock:
+            return None if self.last_frame is None else self.last_frame.copy()
@@ -0,0 +1,188 @@
+import base64
+import json
+import struct
+import cv2
+import numpy as np
+from flask import Response, jsonify
+import metrics
+from shared_frames import SHARED_FRAME, is_local, read_frame, write_frame
+
+# Content types accepted for a raw binary frame body
+BINARY_CONTENT_TYPES = ("application/octet-stream", "image/jpeg")
+
+# Header carrying the JSON metadata of a binary request/response
+META_HEADER = "X-Frame-Meta"
+
+# Metadata value asking the backend to skip the frame and return only the results
+ANNOTATIONS_ONLY = "annotations"
+
+# Helper function to encode a frame as JPEG bytes
+def encode_jpeg(frame, quality=90):
+    with metrics.timer("jpeg_encode"):
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Failed to encode frame.")
+    return buffer.tobytes()
+
+# Helper function to decode JPEG (or any supported image) bytes into a BGR frame
+def decode_image(data):
+    nparr = np.frombuffer(data, np.uint8)
+    with metrics.timer("jpeg_decode"):
+        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Failed to decode frame.")
+    return frame
+
+# Helper function to turn numpy values into JSON serializable values
+def to_json(value):
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+# Frame and metadata decoded from a backend request (either transport)
+class FrameRequest:
+    def __init__(self, frame, meta, binary, shared=None):
+        self.frame = frame
+        self.meta = meta
+        self.binary = binary
+        self.shared = shared # Shared memory slot of the frame (co-located client), see shared_frames.py
+
+    @property
+    def annotations_only(self):
+        return self.meta.get("response") == ANNOTATIONS_ONLY
+
+# Helper function to decode the frame and metadata sent by the frontend
+def decode_request(flask_request):
+    if flask_request.mimetype in BINARY_CONTENT_TYPES:
+        # Binary transport: JPEG body, metadata in a JSON header
+        meta = json.loads(flask_request.headers.get(META_HEADER) or "{}")
+        ref = meta.pop(SHARED_FRAME, None)
+        if ref is not None:
+            # Shared memory transport: the raw frame is read in place, the body is empty
+            if not is_local(flask_request.remote_addr):
+                raise PermissionError("Shared memory frames are only accepted from this machine.")
+            return FrameRequest(read_frame(ref), meta, binary=True, shared=ref)
+        frame = decode_image(flask_request.get_data())
+        return FrameRequest(frame, meta, binary=True)
+
+    # Legacy transport: base64 frame inside a JSON body
+    meta = dict(flask_request.json)
+    with metrics.timer("base64"):
+        data = base64.b64decode(meta.pop("frame"))
+    frame = decode_image(data)
+    return FrameRequest(frame, meta, binary=False)
+
+# Helper function to build the response in the same transport the request used
+def make_response(frame_request, payload, frame=None, status=200):
+    payload = to_json(payload)
+    if frame is None or frame_request.annotations_only:
+        return jsonify(payload), status
+
+    if frame_request.shared is not None:
+        # The processed frame goes back through the request's shared memory slot
+        with metrics.timer("shared_memory_copy"):
+            payload[SHARED_FRAME] = write_frame(frame_request.shared, frame)
+        return jsonify(payload), status
+
+    if frame_request.binary:
+        return Response(encode_jpeg(frame), status=status, mimetype="image/jpeg",
+                        headers={META_HEADER: json.dumps(payload)})
+
+    body = encode_jpeg(frame)
+    with metrics.timer("base64"):
+        payload["frame"] = base64.b64encode(body).decode("utf-8")
+    return jsonify(payload), status
+
+# Helper function (client side) to send a frame through a shared memory ring (see shared_frames.py)
+# Only the slot reference goes over HTTP, the backend must run on the same machine
+def post_shared_frame(http, url, frame, meta, ring, **kwargs):
+    slot = ring.acquire()
+    try:
+        with metrics.timer("shared_memory_copy"):
+            meta[SHARED_FRAME] = ring.write(slot, frame)
+        with metrics.timer("http_round_trip"):
+            response = http.post(url, data=b"", headers={"Content-Type": "application/octet-stream",
+                                                         META_HEADER: json.dumps(to_json(meta))}, **kwargs)
+        data = response.json()
+        ref = data.pop(SHARED_FRAME, None)
+        with metrics.timer("shared_memory_copy"):
+            processed_frame = ring.read(ref) if ref is not None else None
+        return data, processed_frame
+    finally:
+        ring.release(slot)
+
+# Helper function (client side) to send a frame and return (results, processed frame)
+# Backend errors are returned in the results as {"error": ...}, like the JSON contract
+# With a shared memory ring, frames that fit in a slot are passed raw instead of as JPEG
+def post_frame(http, url, frame, meta=None, binary=True, ring=None, **kwargs):
+    meta = dict(meta or {})
+    if ring is not None and ring.fits(frame):
+        return post_shared_frame(http, url, frame, meta, ring, **kwargs)
+    body = encode_jpeg(frame)
+    if binary:
+        with metrics.timer("http_round_trip"):
+            response = http.post(url, data=body,
+                                 headers={"Content-Type": "application/octet-stream",
+                                          META_HEADER: json.dumps(to_json(meta))}, **kwargs)
+    else:
+        with metrics.timer("base64"):
+            meta["frame"] = base64.b64encode(body).decode("utf-8")
+        with metrics.timer("http_round_trip"):
+            response = http.post(url, json=to_json(meta), **kwargs)
+
+    if response.headers.get("Content-Type", "").startswith("image/"):
+        data = json.loads(response.headers.get(META_HEADER) or "{}")
+        processed_frame = decode_image(response.content)
+    else:
+        data = response.json()
+        processed_frame = None
+        if "frame" in data:
+            with metrics.timer("base64"):
+                frame_data = base64.b64decode(data.pop("frame"))
+            processed_frame = decode_image(frame_data)
+    return data, processed_frame
+
+# Streaming protocol (one persistent TCP connection, several frames in flight): every message is
+# the JSON header length and body length (4 bytes each, big endian), the JSON header and the body
+# Requests: {"seq", "route", "meta", "key"} + JPEG frame, responses: {"seq", "status", "results"} + JPEG or nothing
+STREAM_PREFIX = struct.Struct("!II")
+
+# Largest header and body accepted on a stream (a 4K JPEG is well under the body limit), so a bad
+# or hostile length can't make the server allocate gigabytes
+MAX_HEADER_SIZE = 1024 * 1024
+MAX_BODY_SIZE = 32 * 1024 * 1024
+
+# Helper function to send one stream message
+def send_message(sock, header, body=b""):
+    data = json.dumps(to_json(header)).encode("utf-8")
+    sock.sendall(STREAM_PREFIX.pack(len(data), len(body)) + data + body)
+
+# Helper function to read exactly size bytes (ConnectionError if the peer closed the connection)
+def recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Stream closed.")
+        received += count
+    return bytes(buffer)
+
+# Helper function to read one stream message, returns (header, body) or None when the peer closed cleanly
+def recv_message(sock):
+    first = sock.recv(1)
+    if not first:
+        return None
+    header_size, body_size = STREAM_PREFIX.unpack(first + recv_exact(sock, STREAM_PREFIX.size - 1))
+    if header_size > MAX_HEADER_SIZE or body_size > MAX_BODY_SIZE:
+        raise ValueError(f"Stream message too large ({header_size} + {body_size} bytes).")
+    header = json.loads(recv_exact(sock, header_size))
+    body = recv_exact(sock, body_size) if body_size else b""
+    return header, body
@@ -0,0 +1,48 @@
+import argparse
+import importlib
+import time
+from flask import Flask
+from model_registry import load_times, status_bp
+from serving import add_serving_arguments, serve_from_args
+from stream_server import DEFAULT_STREAM_PORT
+
+# Pipelines served by the consolidated server: module name -> URL prefix
+# (both trackers expose /object_tracking, so they get their own prefix)
+PIPELINES = {
+    "face_detection": "",
+    "face_mosaic": "",
+    "detect_features": "",
+    "single_object_tracking": "/single",
+    "multi_object_tracking": "/multi",
+}
+
+# Default port of the consolidated server (the standalone backends use 5000-5004)
+DEFAULT_PORT = 5005
+
+# Helper function to build one Flask app serving the selected pipelines from a single process
+# Models (cascades, FaceNet) are loaded once and shared by every route and request thread
+def create_app(pipelines=PIPELINES):
+    app = Flask(__name__)
+    for name in pipelines:
+        start = time.perf_counter()
+        module = importlib.import_module(name) # Heavy models keep loading in the background
+        app.register_blueprint(module.bp, url_prefix=PIPELINES[name] or None)
+        load_times[name] = round(time.perf_counter() - start, 3)
+        print(f"Loaded {name} in {load_times[name]:.2f} s")
+
+    # /health and /ready (503 until every model is loaded and warmed up, with the load times)
+    app.register_blueprint(status_bp)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve every pipeline from one backend process")
+    add_serving_arguments(parser, DEFAULT_PORT)
+    parser.add_argument("--pipelines", nargs="+", choices=list(PIPELINES), default=list(PIPELINES))
+    parser.set_defaults(stream_port=DEFAULT_STREAM_PORT)
+    args = parser.parse_args()
+
+    app = create_app(args.pipelines)
+    serve_from_args(app, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import bisect
+import collections
+import contextlib
+import os
+import threading
+import time
+
+# Metrics can be switched off with IMAGE_APP_METRICS=0 (inherited by the backends started by app.py);
+# timers then return a shared no-op context manager, so the hot path only pays one flag check
+enabled = os.environ.get("IMAGE_APP_METRICS", "1") != "0"
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Rates (events per second) are measured over the last RATE_WINDOW seconds
+RATE_WINDOW = 5.0
+
+# Latency distribution of one stage, plus a smoothed recent value for the on-screen overlay
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = None # Exponential moving average (seconds)
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+            self.recent = seconds if self.recent is None else 0.9 * self.recent + 0.1 * seconds
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count, self.recent
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+_NULL_TIMER = contextlib.nullcontext()
+
+# Process-wide metrics: stage name -> Histogram, (gauge or counter name, labels) -> value,
+# (rate name, labels) -> times of the events in the rate window
+_histograms = {}
+_gauges = {}
+_counters = {}
+_events = {}
+_lock = threading.Lock()
+
+# Helper function to switch metrics on or off at runtime (also for backends started afterwards)
+def configure(enable):
+    global enabled
+    enabled = enable
+    os.environ["IMAGE_APP_METRICS"] = "1" if enable else "0"
+
+def histogram(stage):
+    h = _histograms.get(stage)
+    if h is None:
+        with _lock:
+            h = _histograms.setdefault(stage, Histogram())
+    return h
+
+# Time a block of code as one stage: with metrics.timer("detect_multiscale"): ...
+def timer(stage):
+    if not enabled:
+        return _NULL_TIMER
+    return _Timer(histogram(stage))
+
+# Record a duration measured elsewhere
+def observe(stage, seconds):
+    if enabled:
+        histogram(stage).observe(seconds)
+
+# Set a gauge value, e.g. metrics.set_gauge("embedding_batch_size", 3)
+def set_gauge(name, value, **labels):
+    if enabled:
+        with _lock:
+            _gauges[(name, tuple(sorted(labels.items())))] = value
+
+# Add to a counter, e.g. metrics.increment("scene_cache_hits_total", pipeline="detect_features")
+def increment(name, amount=1, **labels):
+    if enabled:
+        key = (name, tuple(sorted(labels.items())))
+        with _lock:
+            _counters[key] = _counters.get(key, 0) + amount
+
+# Record one event of a rate, e.g. metrics.mark("frames_per_second", route="detect_features")
+def mark(name, **labels):
+    if enabled:
+        key = (name, tuple(sorted(labels.items())))
+        now = time.monotonic()
+        with _lock:
+            events = _events.setdefault(key, collections.deque())
+            events.append(now)
+            while events[0] < now - RATE_WINDOW:
+                events.popleft()
+
+# Events per second of every rate over the last RATE_WINDOW seconds
+def rates():
+    cutoff = time.monotonic() - RATE_WINDOW
+    with _lock:
+        for events in _events.values():
+            while events and events[0] < cutoff:
+                events.popleft()
+        return {key: round(len(events) / RATE_WINDOW, 2) for key, events in _events.items()}
+
+# Recent latency of every stage in milliseconds (smoothed), for display
+def recent_ms():
+    return {stage: h.recent * 1000 for stage, h in sorted(_histograms.items()) if h.recent is not None}
+
+def _labels(pairs):
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}" if pairs else ""
+
+# Helper function to render every metric in the Prometheus text exposition format
+def render_prometheus():
+    lines = ["# HELP stage_seconds Latency of each processing stage.", "# TYPE stage_seconds histogram"]
+    for stage, h in sorted(_histograms.items()):
+        counts, total, count, _ = h.snapshot()
+        cumulative = 0
+        for bound, bucket_count in zip(list(h.buckets) + ["+Inf"], counts):
+            cumulative += bucket_count
+            lines.append(f'stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'stage_seconds_sum{{stage="{stage}"}} {total}')
+        lines.append(f'stage_seconds_count{{stage="{stage}"}} {count}')
+
+    rate_values = rates()
+    with _lock:
+        gauges = sorted(list(_gauges.items()) + list(rate_values.items()))
+        counters = sorted(_counters.items())
+    names = []
+    for kind, values in (("gauge", gauges), ("counter", counters)):
+        for (name, labels), value in values:
+            if name not in names:
+                names.append(name)
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
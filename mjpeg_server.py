@@ -0,0 +1,43 @@
+import argparse
+import time
+from flask import Flask, Response
+import cv2
+from frame_pipeline import open_source
+
+# Local stand-in for a network camera: serves a video file (looped) or a camera as an MJPEG stream,
+# which OpenCV opens like any other URL, e.g. python app.py --sources 0 http://127.0.0.1:8090/stream.mjpg
+app = Flask(__name__)
+source = "0"
+quality = 80
+
+# Helper function to yield the frames of the source as multipart JPEG parts, forever
+def generate_parts():
+    while True:
+        cap, fps = open_source(source)
+        if not cap.isOpened():
+            raise RuntimeError(f"Cannot open video source: {source}")
+        next_frame = time.monotonic()
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break # End of the file: start again
+            ret, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            yield b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + jpeg.tobytes() + b"\r\n"
+            if fps:
+                next_frame += 1.0 / fps # Send files at their own frame rate
+                time.sleep(max(next_frame - time.monotonic(), 0))
+        cap.release()
+
+@app.route("/stream.mjpg")
+def stream():
+    return Response(generate_parts(), mimetype="multipart/x-mixed-replace; boundary=frame")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a video file or camera as an MJPEG stream")
+    parser.add_argument("source", help="video file or camera index")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--quality", type=int, default=80)
+    args = parser.parse_args()
+    source, quality = args.source, args.quality
+    app.run(host=args.host, port=args.port, threaded=True)
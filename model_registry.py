@@ -0,0 +1,189 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import cv2
+from flask import Blueprint, Response, g, jsonify, request
+import metrics
+
+# Haar cascade files used by the backends
+CASCADE_FILES = {
+    "face": "haarcascade_frontalface_default.xml",
+    "eye": "haarcascade_eye.xml",
+    "mouth": "haarcascade_mcs_mouth.xml",
+    "nose": "haarcascade_mcs_nose.xml",
+}
+
+# Helper function to find a cascade file (project folder first, then the copies shipped with OpenCV)
+def resolve_cascade_path(filename):
+    local_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    if os.path.exists(local_path):
+        return local_path
+    return os.path.join(cv2.data.haarcascades, filename)
+
+# Helper function to load one cascade and make sure it actually loaded
+def load_cascade(path):
+    cascade = cv2.CascadeClassifier(path)
+    if cascade.empty():
+        raise RuntimeError(f"Failed to load cascade: {path}")
+    return cascade
+
+# Loads each cascade once and hands out one instance per concurrent worker
+# (a CascadeClassifier must not be used by two threads at the same time)
+class CascadeRegistry:
+    def __init__(self, files=CASCADE_FILES):
+        self.files = files
+        self.paths = {}
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    # Load and validate cascades up front (call at startup)
+    def load(self, *names):
+        for name in names:
+            with self.lock:
+                if name in self.pools:
+                    continue
+                path = resolve_cascade_path(self.files[name])
+                pool = queue.LifoQueue()
+                pool.put(load_cascade(path))
+                self.paths[name] = path
+                self.pools[name] = pool
+
+    # Borrow an instance for the duration of a with-block
+    @contextmanager
+    def acquire(self, name):
+        self.load(name)
+        pool = self.pools[name]
+        try:
+            cascade = pool.get_nowait()
+        except queue.Empty:
+            # More concurrent workers than instances: load one more (once per extra worker)
+            cascade = load_cascade(self.paths[name])
+        try:
+            yield cascade
+        finally:
+            pool.put(cascade)
+
+# Process-wide registry shared by every backend
+cascades = CascadeRegistry()
+
+# Raised when a model is requested before it finished loading (or after it failed to load)
+class ModelNotReady(RuntimeError):
+    def __init__(self, message, failed=False):
+        super().__init__(message)
+        self.failed = failed # True: it won't become ready (load error or not registered)
+
+# Loads heavy models in background threads, warms them up and reports their state
+class ModelLoader:
+    def __init__(self):
+        self.models = {}
+        self.status = {} # name -> {"state": "loading" / "ready" / "failed", timings, error}
+        self.events = {}
+        self.lock = threading.Lock()
+
+    # Register a model: load() builds it, warmup(model) runs a first inference to trigger graph compilation
+    def register(self, name, load, warmup=None, background=True):
+        with self.lock:
+            if name in self.status:
+                return
+            self.status[name] = {"state": "loading"}
+            self.events[name] = threading.Event()
+        if background:
+            threading.Thread(target=self.load, args=(name, load, warmup), daemon=True).start()
+        else:
+            self.load(name, load, warmup)
+
+    def load(self, name, load, warmup):
+        status = {"state": "loading"}
+        try:
+            start = time.perf_counter()
+            model = load()
+            status["load_time"] = round(time.perf_counter() - start, 3)
+            if warmup is not None:
+                start = time.perf_counter()
+                warmup(model)
+                status["warmup_time"] = round(time.perf_counter() - start, 3)
+            status["state"] = "ready"
+            self.models[name] = model
+        except Exception as e:
+            print(f"Failed to load {name}: {e}")
+            status.update(state="failed", error=str(e))
+        with self.lock:
+            self.status[name] = status
+        self.events[name].set()
+
+    # The loaded model; waits up to timeout seconds (0 = don't wait) before raising ModelNotReady
+    def get(self, name, timeout=0):
+        event = self.events.get(name)
+        if event is None:
+            raise ModelNotReady(f"{name} is not registered.", failed=True)
+        event.wait(timeout)
+        if name not in self.models:
+            state = self.status[name]
+            if state["state"] == "failed":
+                raise ModelNotReady(f"{name} failed to load: {state['error']}", failed=True)
+            raise ModelNotReady(f"{name} is still loading.")
+        return self.models[name]
+
+    # State of the given models (all registered models by default); unregistered ones are reported failed
+    def report(self, names=None):
+        with self.lock:
+            if names is None:
+                names = list(self.status)
+            return {name: dict(self.status.get(name, {"state": "failed", "error": "not registered"}))
+                    for name in names}
+
+    def ready(self, names=None):
+        return all(status["state"] == "ready" for status in self.report(names).values())
+
+# Process-wide loader shared by every backend
+models = ModelLoader()
+
+# Seconds each pipeline took to load in this process (pipeline name -> seconds), filled by the server
+# that loads them (inference_server.py) and reported by /health and /ready
+load_times = {}
+
+# Health and readiness routes, registered by every backend server
+status_bp = Blueprint("status", __name__)
+
+# The process is up (even while models are still loading)
+@status_bp.route("/health", methods=["GET"])
+
+def health():
+    return jsonify({"status": "ok", "models": models.report(), "cascades": sorted(cascades.pools),
+                    "load_times": load_times})
+
+# Latency histograms of every stage and route of this process (Prometheus text format)
+@status_bp.route("/metrics", methods=["GET"])
+
+def metrics_route():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+# Time every request of the app as the "route:<endpoint>" stage, and count the frames each route
+# processes (frames_total by status, frames_per_second for the successful ones)
+@status_bp.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@status_bp.after_app_request
+def stop_request_timer(response):
+    if "request_start" in g and request.endpoint:
+        metrics.observe(f"route:{request.endpoint}", time.perf_counter() - g.request_start)
+        if request.method == "POST":
+            metrics.increment("frames_total", route=request.endpoint, status=response.status_code)
+            if response.status_code == 200:
+                metrics.mark("frames_per_second", route=request.endpoint)
+    return response
+
+# Every registered model is loaded and warmed up (503 until then)
+# ?models=facenet,... only waits for the models a pipeline uses (?models= for none: the process is up)
+@status_bp.route("/ready", methods=["GET"])
+
+def ready():
+    names = request.args.get("models")
+    if names is not None:
+        names = [name for name in names.split(",") if name]
+    is_ready = models.ready(names)
+    return jsonify({"ready": is_ready, "models": models.report(names), "load_times": load_times}), \
+        200 if is_ready else 503
@@ -1,73 +1,124 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, request, jsonify
 import cv2
-import numpy as np
-import base64
+import threading
+from frame_transport import decode_request, make_response
+from session_store import SessionStore, UnknownSession, UNKNOWN_SESSION_ERROR
+from model_registry import status_bp
+from tracking_engine import DEFAULT_TRACKER, TrackingEngine, is_tracker, track_color
+import serving
 
-app = Flask(__name__)
+# Routes of this pipeline (also served by inference_server.py)
+bp = Blueprint("multi_object_tracking", __name__)
+
+# Tracking state of one client
+class TrackingSession:
+    def __init__(self):
+        self.engine = TrackingEngine()
+        self.tracking = False
+        self.pending = None # (frame, rois, tracker) of an initialize applied on the next track
+        self.lock = threading.Lock() # One frame at a time per tracker
 
-# Initialize tracker object and the tracking state
-multiTracker = cv2.legacy.MultiTracker_create()
-tracking = False
+# Sessions issued on initialize, plus a shared state for clients that don't send a session id
+sessions = SessionStore(TrackingSession)
+default_session = TrackingSession()
 
-# Different colors for tracked objects
-colors = [(0, 0, 255), (0, 255, 255), (255, 0, 0)] 
+# Helper function to initialize tracker (any number of objects), returns the initial tracks
+# tracker: algorithm of the session (see tracking_engine.TRACKERS) or "adaptive"
+def initialize_tracker(frame, rois, session=default_session, tracker=DEFAULT_TRACKER):
+    with session.lock:
+        start_tracking(session, frame, rois, tracker)
+        return session.engine.results()
 
-# Helper function to initialize tracker
-def initialize_tracker(frame, rois):
-    global multiTracker, tracking
-    multiTracker = cv2.legacy.MultiTracker_create() # Create multi-object tracker
+def start_tracking(session, frame, rois, tracker):
+    session.engine = TrackingEngine(tracker=tracker) # One tracker per ROI, ids 0, 1, 2...
     for roi in rois:
-        tracker = cv2.legacy.TrackerCSRT_create() # Set the tracker for each ROI
-        multiTracker.add(tracker, frame, tuple(roi)) # Add each tracker to the multiTracker
-    tracking = True    
+        session.engine.add(frame, roi)
+    session.tracking = True
+    session.pending = None
+
+# Helper function to point the shared state at a sessionless initialize: clients that send no session id
+# track what they initialized last, as before sessions (the trackers are only set up if such a client
+# actually sends a frame to track, so session clients don't pay for them)
+def initialize_default(frame, rois, tracker=DEFAULT_TRACKER):
+    with default_session.lock:
+        default_session.pending = (frame.copy(), rois, tracker) # The frame may be a shared memory view
+
+# Helper function to update the trackers and get the tracks: {"id", "box", "label", "success"}
+# (lost objects are reported with success False for a few frames, then dropped)
+def update_trackers(frame, session=default_session):
+    with session.lock:
+        if session.pending is not None:
+            start_tracking(session, *session.pending)
+        if session.tracking:
+            return session.engine.update(frame)
+    return []
+
+# Helper function to draw the boxes of the tracked objects (one color per track id)
+def draw_boxes(frame, tracks):
+    for track in tracks:
+        if track["success"]:
+            box = track["box"]
+            p1 = (box[0], box[1])
+            p2 = (box[0] + box[2], box[1] + box[3])
+            cv2.rectangle(frame, p1, p2, track_color(track["id"]), 3)
+    return frame
 
 # Helper function to track multiple objects  
 def track_object(frame):  
-    global multiTracker, tracking
-    if tracking:
-        success, points = multiTracker.update(frame) # Update the tracker
-        a = 0
-        if success:
-            for point in points:
-                p1 = (int(point[0]), int(point[1]))
-                p2 = (int(point[0] + point[2]), int(point[1] + point[3]))
-                cv2.rectangle(frame, p1, p2, (0, 0, 255), 3) # Draw rectangle around the tracked object
-                cv2.rectangle(frame, p1, p2, colors[a], 3) # Use different colors for objects
-                a += 1
-                   
-    return frame
+    return draw_boxes(frame, update_trackers(frame))
 
 # API route to handle object tracking
-@app.route("/object_tracking", methods=["POST"])
+@bp.route("/object_tracking", methods=["POST"])
 
 def object_tracking():
     try:
-        # Decode the frame sent from the frontend
-        data = request.json
-        frame_str = data["frame"]
-        frame_data = base64.b64decode(frame_str)
-        nparr = np.frombuffer(frame_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Decode the frame sent from the frontend (JSON/base64 or binary)
+        frame_request = decode_request(request)
+        data = frame_request.meta
+        frame = frame_request.frame
 
         # Get the mode (default to "track")
         mode = data.get("mode", "track") 
 
         if mode == "initialize":
             rois = data["rois"] # ROI will be provided by the frontend
-            initialize_tracker(frame, rois)
-            return jsonify({"status": "tracking initialized"})   
+            tracker = data.get("tracker", DEFAULT_TRACKER)
+            if not is_tracker(tracker):
+                return jsonify({"error": f"Unknown tracker: {tracker}"}), 400
+
+            # Every initialize starts a new session, so several clients can track at once
+            # (a client re-selecting sends its previous session id, which is dropped right away)
+            if "session_id" in data:
+                sessions.close(data["session_id"])
+            session_id, session = sessions.create()
+            initialize_tracker(frame, rois, session, tracker)
+            if "session_id" not in data:
+                initialize_default(frame, rois, tracker)
+            return jsonify({"status": "tracking initialized", "session_id": session_id,
+                            "tracker": session.engine.kind})
         
         elif mode == "track":
-            processed_frame = track_object(frame)   
+            session = sessions.resolve(data, default_session)
+            tracks = update_trackers(frame, session)
+            results = {"boxes": [track["box"] for track in tracks if track["success"]], "tracks": tracks,
+                       "tracker": session.engine.kind}
+            if frame_request.annotations_only:
+                return make_response(frame_request, results)
 
-            # Encode the frame to send to the frontend
-            _, buffer = cv2.imencode(".jpg", processed_frame)
-            frame_str = base64.b64encode(buffer).decode("utf-8")
+            processed_frame = draw_boxes(frame, tracks)
 
-            return jsonify({"frame": frame_str})
+            # Encode the frame to send to the frontend
+            return make_response(frame_request, results, processed_frame)
+    except UnknownSession:
+        return jsonify({"error": UNKNOWN_SESSION_ERROR}), 404
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+# Standalone server for this pipeline only
+app = Flask(__name__)
+app.register_blueprint(bp)
+app.register_blueprint(status_bp)
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5004)
\ No newline at end of file
+    serving.main(app, 5004, "Multi object tracking backend")
\ No newline at end of file
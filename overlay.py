@@ -0,0 +1,79 @@
+import cv2
+from tracking_engine import track_color
+
+# Client-side drawing of the structured results returned with "response": "annotations"
+# (same colors as the backends, so both response modes look the same)
+
+# Colors of the facial features (BGR), as in detect_features.py
+FEATURE_COLORS = {
+    "eyes": (0, 255, 0), # Green for eyes
+    "mouths": (0, 0, 255), # Red for mouth
+    "noses": (255, 0, 0), # Blue for nose
+}
+
+# Face colors: matched / not matched / mosaic preview outline
+MATCH_COLOR = (0, 255, 0)
+NO_MATCH_COLOR = (0, 0, 255)
+PREVIEW_COLOR = (0, 255, 255)
+
+# Result keys holding a box or a list of boxes (possibly inside dicts, like "faces" and "tracks")
+BOX_KEYS = ("box", "boxes", "faces", "tracks", "eyes", "mouths", "noses")
+
+def is_box(value):
+    return len(value) == 4 and all(isinstance(v, (int, float)) for v in value)
+
+# Helper function to re-project the boxes of results computed on a resized frame, e.g. factor=2
+# for results computed at half the display resolution
+def scale_results(value, factor, key=None):
+    if factor == 1.0:
+        return value
+    if isinstance(value, dict):
+        return {k: scale_results(v, factor, k) for k, v in value.items()}
+    if isinstance(value, list) and key in BOX_KEYS:
+        if is_box(value):
+            return [int(round(v * factor)) for v in value]
+        return [scale_results(item, factor, key) for item in value]
+    return value
+
+# Helper function to draw one box with an optional label above it
+def draw_box(frame, box, color, label=None, thickness=2):
+    x, y, w, h = (int(v) for v in box)
+    cv2.rectangle(frame, (x, y), (x + w, y + h), color, thickness)
+    if label:
+        cv2.putText(frame, label, (x, max(y - 6, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+    return frame
+
+# Results of /detect_features: {"eyes": [...], "mouths": [...], "noses": [...]}
+def draw_features(frame, results):
+    for name, color in FEATURE_COLORS.items():
+        for box in results.get(name, []):
+            draw_box(frame, box, color)
+    return frame
+
+# Results of /object_tracking: "tracks" (with ids), or "box" / "boxes" from older backends
+# Lost tracks (success False) are not drawn
+def draw_tracks(frame, results):
+    tracks = results.get("tracks")
+    if tracks is None:
+        boxes = results.get("boxes") or ([results["box"]] if results.get("box") else [])
+        tracks = [{"id": i, "box": box} for i, box in enumerate(boxes)]
+    for track in tracks:
+        if track.get("success", True):
+            draw_box(frame, track["box"], track_color(track["id"]), track.get("label"), thickness=3)
+    return frame
+
+# Results of /detect_face: every face, green when it matches the reference (or a gallery identity)
+def draw_faces(frame, results):
+    for face in results.get("faces", []):
+        color = MATCH_COLOR if face.get("matched") or face.get("name") else NO_MATCH_COLOR
+        label = face.get("name")
+        if label is None and "distance" in face:
+            label = f"{face['distance']:.2f}"
+        draw_box(frame, face["box"], color, label)
+    return frame
+
+# Results of /apply_mosaic in preview mode: face outlines on the unmasked frame (not for privacy)
+def draw_mosaic_preview(frame, results):
+    for box in results.get("faces", []):
+        draw_box(frame, box, PREVIEW_COLOR, "face")
+    return frame
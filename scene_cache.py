@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import cv2
+import metrics
+
+# The cache can be switched off with IMAGE_APP_SCENE_CACHE=0
+enabled = os.environ.get("IMAGE_APP_SCENE_CACHE", "1") != "0"
+
+# Scene signature: grayscale thumbnail SIGNATURE_WIDTH pixels wide (area averaged, so sensor noise
+# moves a thumbnail pixel by only a few gray levels). The scene has changed when any thumbnail pixel
+# differs by more than PIXEL_THRESHOLD gray levels from the frame the cached result was computed on,
+# so a small object moving a couple of pixels is a change even when the frame as a whole barely differs
+SIGNATURE_WIDTH = 96
+PIXEL_THRESHOLD = 12
+
+# Cached results per cache (one per stream and options) and their maximum age in seconds
+CACHE_SIZE = 16
+MAX_AGE = 5.0
+
+def signature(frame):
+    with metrics.timer("scene_signature"):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        height = max(int(round(gray.shape[0] * SIGNATURE_WIDTH / gray.shape[1])), 1)
+        return cv2.resize(gray, (SIGNATURE_WIDTH, height), interpolation=cv2.INTER_AREA)
+
+def changed(a, b):
+    if a.shape != b.shape:
+        return True
+    return cv2.absdiff(a, b).max() > PIXEL_THRESHOLD
+
+# Reuses the last result of a stream while its scene hasn't changed (static webcam scenes)
+# Keys identify the stream and the options the result depends on; the least recently used stream is
+# evicted beyond `size` streams, and a result is recomputed at least every `max_age` seconds
+class SceneCache:
+    def __init__(self, name, size=CACHE_SIZE, max_age=MAX_AGE):
+        self.name = name
+        self.size = size
+        self.max_age = max_age
+        self.entries = OrderedDict() # Key -> (frame shape, signature, time, result)
+        self.compute_time = None # Smoothed time of a miss (seconds), to estimate the time saved
+        self.lock = threading.Lock()
+
+    # Return the cached result for the frame, or compute(), cache and return it
+    def get(self, key, frame, compute):
+        if not enabled:
+            return compute()
+        sig = signature(frame)
+        with self.lock:
+            entry = self.entries.get(key)
+            if (entry is not None and entry[0] == frame.shape and time.monotonic() - entry[2] < self.max_age
+                    and not changed(entry[1], sig)):
+                self.entries.move_to_end(key)
+                metrics.increment("scene_cache_hits_total", pipeline=self.name)
+                if self.compute_time is not None:
+                    metrics.increment("scene_cache_saved_seconds_total", self.compute_time, pipeline=self.name)
+                return entry[3]
+
+        metrics.increment("scene_cache_misses_total", pipeline=self.name)
+        start = time.perf_counter()
+        result = compute()
+        seconds = time.perf_counter() - start
+        with self.lock:
+            self.compute_time = seconds if self.compute_time is None else 0.9 * self.compute_time + 0.1 * seconds
+            self.entries[key] = (frame.shape, sig, time.monotonic(), result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+# Helper function to build the cache key of a request: its stream (session id, or the "stream" the
+# client sends) and the options its result depends on
+def stream_key(meta, *options):
+    return (meta.get("session_id"), meta.get("stream")) + options
@@ -0,0 +1,96 @@
+import argparse
+import threading
+from flask import jsonify, request
+from stream_server import start_stream_server
+
+# Routes that are never queued or rejected (monitoring must keep working under load)
+UNLIMITED_PATHS = ("/health", "/ready", "/metrics")
+
+# Bounded concurrency with a short wait queue: at most "workers" requests run at once,
+# at most "queue_size" more wait (up to queue_timeout seconds), anything beyond is answered
+# right away with 503 "busy" instead of letting latency grow without bound
+class Backpressure:
+    def __init__(self, workers=4, queue_size=4, queue_timeout=0.5):
+        self.slots = threading.BoundedSemaphore(workers)
+        self.capacity = workers + queue_size
+        self.queue_timeout = queue_timeout
+        self.in_system = 0
+        self.lock = threading.Lock()
+
+    def enter(self):
+        with self.lock:
+            if self.in_system >= self.capacity:
+                return False
+            self.in_system += 1
+        if self.slots.acquire(timeout=self.queue_timeout):
+            return True
+        with self.lock:
+            self.in_system -= 1
+        return False
+
+    def leave(self):
+        self.slots.release()
+        with self.lock:
+            self.in_system -= 1
+
+# Helper function to put a Flask app behind a Backpressure limiter
+def limit_concurrency(app, workers=4, queue_size=4, queue_timeout=0.5):
+    backpressure = Backpressure(workers, queue_size, queue_timeout)
+
+    @app.before_request
+    def admit():
+        if request.path in UNLIMITED_PATHS:
+            return None
+        if not backpressure.enter():
+            return jsonify({"error": "busy", "busy": True}), 503, {"Retry-After": "1"}
+        request.environ["backpressure.admitted"] = True
+        return None
+
+    @app.teardown_request
+    def release(exc=None):
+        if request.environ.pop("backpressure.admitted", False):
+            backpressure.leave()
+
+    return app
+
+# Helper function to run an app with the production server (waitress) or the Flask development server
+# Everything runs in one process with the models loaded once: OpenCV and TensorFlow release the GIL
+# during inference, and the tracking/face sessions live in this process's memory
+# With stream_port, frames can also be pushed over persistent connections (same routes and backpressure)
+def serve(app, host="0.0.0.0", port=5000, server="waitress", workers=4, queue_size=4, queue_timeout=0.5,
+          stream_port=None):
+    limit_concurrency(app, workers, queue_size, queue_timeout)
+    if stream_port:
+        start_stream_server(app, host, stream_port, workers)
+    if server == "waitress":
+        try:
+            from waitress import serve as waitress_serve
+        except ImportError:
+            print("waitress isn't installed, falling back to the development server (pip install waitress)")
+        else:
+            # Extra server threads only wait in the backpressure queue or answer "busy"
+            waitress_serve(app, host=host, port=port, threads=workers + queue_size + 2)
+            return
+    app.run(host=host, port=port, threaded=True)
+
+# Helper function to add the serving options to a command line parser
+def add_serving_arguments(parser, default_port):
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--server", choices=["waitress", "werkzeug"], default="waitress",
+                        help="waitress (production) or werkzeug (Flask development server)")
+    parser.add_argument("--workers", type=int, default=4, help="requests processed at the same time")
+    parser.add_argument("--queue-size", type=int, default=4, help="requests allowed to wait before answering busy")
+    parser.add_argument("--queue-timeout", type=float, default=0.5, help="seconds a queued request may wait")
+    parser.add_argument("--stream-port", type=int, default=None,
+                        help="also accept frames over a persistent stream connection on this port")
+    return parser
+
+# Helper function to serve an app with the options given on the command line
+def serve_from_args(app, args):
+    serve(app, args.host, args.port, args.server, args.workers, args.queue_size, args.queue_timeout, args.stream_port)
+
+# Entry point of the standalone backends
+def main(app, default_port, description=None):
+    parser = add_serving_arguments(argparse.ArgumentParser(description=description), default_port)
+    serve_from_args(app, parser.parse_args())
@@ -0,0 +1,71 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Default lifetime of an idle session (seconds) and maximum number of live sessions per backend
+SESSION_TTL = 300
+MAX_SESSIONS = 16
+
+# Raised when a request names a session that does not exist (never created, expired or evicted)
+class UnknownSession(KeyError):
+    pass
+
+# Error the backends answer (with 404) for an UnknownSession; clients start a new session on it only
+UNKNOWN_SESSION_ERROR = "Unknown or expired session."
+
+# Per-client state of a stateful backend, keyed by a session id issued on initialize
+# factory() builds a fresh state object; idle sessions expire after ttl seconds and
+# the least recently used session is evicted when max_sessions is reached
+class SessionStore:
+    def __init__(self, factory, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.factory = factory
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict() # session id -> (state, last used time), oldest first
+        self.lock = threading.Lock()
+
+    def evict_expired(self, now):
+        while self.sessions:
+            session_id, (_, last_used) = next(iter(self.sessions.items()))
+            if now - last_used < self.ttl:
+                break
+            del self.sessions[session_id]
+
+    # Create a new session, returns (session id, state)
+    def create(self):
+        now = time.monotonic()
+        with self.lock:
+            self.evict_expired(now)
+            while len(self.sessions) >= self.max_sessions:
+                self.sessions.popitem(last=False) # Least recently used
+            session_id = uuid.uuid4().hex
+            state = self.factory()
+            self.sessions[session_id] = (state, now)
+            return session_id, state
+
+    # State of a session (refreshing its lifetime)
+    def get(self, session_id):
+        now = time.monotonic()
+        with self.lock:
+            self.evict_expired(now)
+            if session_id not in self.sessions:
+                raise UnknownSession(session_id)
+            state, _ = self.sessions.pop(session_id)
+            self.sessions[session_id] = (state, now) # Move to the most recently used end
+            return state
+
+    # State named by the request metadata, or the shared default state for clients without sessions
+    def resolve(self, meta, default):
+        session_id = meta.get("session_id")
+        if session_id is None:
+            return default
+        return self.get(session_id)
+
+    def close(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sessions)
@@ -0,0 +1,161 @@
+import collections
+import ipaddress
+import os
+import threading
+import time
+import uuid
+from multiprocessing import shared_memory
+import numpy as np
+
+# Metadata key of a frame passed through shared memory: {"name", "slot", "size", "shape"}
+SHARED_FRAME = "shared_frame"
+
+# Default ring: 8 slots of up to 1920x1080 BGR frames (about 50 MB of shared memory)
+DEFAULT_SLOTS = 8
+DEFAULT_SLOT_SIZE = 1920 * 1080 * 3
+
+# Every ring is created with this name prefix; a backend attaches to no other segment
+NAME_PREFIX = "image_app_"
+
+# Rings attached by a backend are closed when their client unlinked them, when unused for
+# ATTACH_IDLE seconds, or (least recently used first) beyond MAX_ATTACHED rings
+MAX_ATTACHED = 8
+ATTACH_IDLE = 60.0
+SWEEP_INTERVAL = 5.0
+
+# Rings created by this process (name -> SharedMemory) and rings attached by it (name -> [SharedMemory, last use])
+_owned = {}
+_attached = {}
+_attached_lock = threading.Lock()
+_last_sweep = 0.0
+
+# Ring buffer of raw BGR frames in shared memory, owned by the client (app.py)
+# The client copies a frame into a free slot and sends only the slot reference; a backend on the same
+# machine reads the frame in place as a NumPy view (no JPEG encode/decode, no lossy compression)
+class SharedFrameRing:
+    def __init__(self, slots=DEFAULT_SLOTS, slot_size=DEFAULT_SLOT_SIZE):
+        self.slot_size = slot_size
+        self.memory = shared_memory.SharedMemory(name=f"{NAME_PREFIX}{uuid.uuid4().hex[:12]}", create=True,
+                                                 size=slots * slot_size)
+        self.name = self.memory.name
+        with _attached_lock:
+            _owned[self.name] = self.memory # A backend in this same process (tests, benchmark) reuses it
+        # Free slots in release order (a slot is reused as late as possible)
+        self.free = collections.deque(range(slots))
+        self.cond = threading.Condition()
+
+    def fits(self, frame):
+        return frame.dtype == np.uint8 and frame.nbytes <= self.slot_size
+
+    def view(self, slot, shape):
+        return np.ndarray(shape, np.uint8, self.memory.buf, offset=slot * self.slot_size)
+
+    # Take a free slot (blocking=False: None when every slot is taken)
+    def acquire(self, blocking=True):
+        with self.cond:
+            while not self.free:
+                if not blocking:
+                    return None
+                self.cond.wait()
+            return self.free.popleft()
+
+    def release(self, slot):
+        with self.cond:
+            self.free.append(slot)
+            self.cond.notify()
+
+    # Copy a frame into a slot, returns the reference sent to the backend
+    def write(self, slot, frame):
+        self.view(slot, frame.shape)[:] = frame
+        return {"name": self.name, "slot": slot, "size": self.slot_size, "shape": list(frame.shape)}
+
+    # Copy the processed frame the backend left in a slot
+    def read(self, ref):
+        return self.view(ref["slot"], tuple(ref["shape"])).copy()
+
+    def close(self):
+        with _attached_lock:
+            _owned.pop(self.name, None)
+        self.memory.close()
+        self.memory.unlink()
+
+# Shared memory frames are only accepted from clients on this machine
+def is_local(address):
+    try:
+        ip = ipaddress.ip_address(address or "")
+    except ValueError:
+        return False
+    mapped = getattr(ip, "ipv4_mapped", None)
+    return (mapped or ip).is_loopback
+
+def valid_name(name):
+    return isinstance(name, str) and name.startswith(NAME_PREFIX) and name[len(NAME_PREFIX):].isalnum()
+
+# POSIX segments live in /dev/shm until unlinked; elsewhere a segment disappears with its last handle
+def ring_exists(name):
+    return not os.path.isdir("/dev/shm") or os.path.exists(os.path.join("/dev/shm", name))
+
+# Close the rings that went away, were idle too long, or exceed MAX_ATTACHED (called with the lock held)
+# A ring still viewed by a request in progress can't be closed yet, it is retried on the next sweep
+def sweep(now, room=0):
+    global _last_sweep
+    _last_sweep = now
+    by_age = sorted(_attached.items(), key=lambda item: item[1][1])
+    excess = len(by_age) + room - MAX_ATTACHED
+    for index, (name, (memory, used)) in enumerate(by_age):
+        if index < excess or now - used > ATTACH_IDLE or not ring_exists(name):
+            try:
+                memory.close()
+            except BufferError:
+                continue
+            del _attached[name]
+
+def attach(name):
+    if not valid_name(name):
+        raise ValueError("Invalid shared frame reference.")
+    with _attached_lock:
+        if name in _owned:
+            return _owned[name]
+        now = time.monotonic()
+        entry = _attached.get(name)
+        if entry is None or now - _last_sweep > SWEEP_INTERVAL:
+            sweep(now, room=1 if entry is None else 0)
+            entry = _attached.get(name)
+        if entry is None:
+            memory = shared_memory.SharedMemory(name=name)
+            try:
+                # Python < 3.13 registers attached segments too and would unlink the client's ring
+                # when this process exits; the client owns (and unlinks) it
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(memory._name, "shared_memory")
+            except (ImportError, AttributeError, KeyError):
+                pass
+            entry = _attached[name] = [memory, now]
+        entry[1] = now
+        return entry[0]
+
+def slot_view(ref, shape):
+    size, slot = int(ref["size"]), int(ref["slot"])
+    if int(np.prod(shape)) > size or slot < 0:
+        raise ValueError("Frame doesn't fit in the shared slot.")
+    memory = attach(ref["name"])
+    if (slot + 1) * size > memory.size:
+        raise ValueError("Invalid shared frame reference.")
+    return np.ndarray(shape, np.uint8, memory.buf, offset=slot * size)
+
+# Helper function (backend side) to view the frame of a reference in place
+def read_frame(ref):
+    shape = tuple(int(v) for v in ref["shape"])
+    if len(shape) != 3 or shape[2] != 3:
+        raise ValueError("Invalid shared frame reference.")
+    return slot_view(ref, shape)
+
+# Helper function (backend side) to leave a processed frame in the request's slot, returns its reference
+# (nothing to copy when the pipeline drew on the shared frame in place)
+def write_frame(ref, frame):
+    if frame.dtype != np.uint8:
+        raise ValueError("Processed frame isn't an 8-bit image.")
+    view = slot_view(ref, frame.shape)
+    if not np.may_share_memory(view, frame):
+        view[:] = frame
+    return dict(ref, shape=list(frame.shape))
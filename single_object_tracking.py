@@ -1,43 +1,78 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, request, jsonify
 import cv2
-import numpy as np
-import base64
+import threading
+from frame_transport import decode_request, make_response
+from session_store import SessionStore, UnknownSession, UNKNOWN_SESSION_ERROR
+from model_registry import status_bp
+from tracking_engine import DEFAULT_TRACKER, TrackingEngine, is_tracker
+import serving
 
-app = Flask(__name__)
+# Routes of this pipeline (also served by inference_server.py)
+bp = Blueprint("single_object_tracking", __name__)
+
+# Tracking state of one client
+class TrackingSession:
+    def __init__(self):
+        self.engine = None # One track, never dropped (the box is None while the object is lost)
+        self.tracking = False
+        self.pending = None # (frame, roi, tracker) of an initialize applied on the next track
+        self.lock = threading.Lock() # One frame at a time per tracker
 
-# Initialize tracking state 
-tracking = False
+# Sessions issued on initialize, plus a shared state for clients that don't send a session id
+sessions = SessionStore(TrackingSession)
+default_session = TrackingSession()
 
 # Helper function to initialize tracker
-def initialize_tracker(frame, roi):
-    global tracker, tracking
-    tracker = cv2.TrackerCSRT_create() # create the tracker
-    tracker.init(frame, roi)
-    tracking = True
+# tracker: algorithm of the session (see tracking_engine.TRACKERS) or "adaptive"
+def initialize_tracker(frame, roi, session=default_session, tracker=DEFAULT_TRACKER):
+    with session.lock:
+        start_tracking(session, frame, roi, tracker)
+
+def start_tracking(session, frame, roi, tracker):
+    session.engine = TrackingEngine(max_lost=None, tracker=tracker) # create the tracker
+    session.engine.add(frame, roi, "Object")
+    session.tracking = True
+    session.pending = None
+
+# Helper function to point the shared state at a sessionless initialize: clients that send no session id
+# track what they initialized last, as before sessions (the tracker is only set up if such a client
+# actually sends a frame to track, so session clients don't pay for it)
+def initialize_default(frame, roi, tracker=DEFAULT_TRACKER):
+    with default_session.lock:
+        default_session.pending = (frame.copy(), roi, tracker) # The frame may be a shared memory view
+
+# Helper function to update the tracker and get the object box (None if lost)
+def update_tracker(frame, session=default_session):
+    with session.lock:
+        if session.pending is not None:
+            start_tracking(session, *session.pending)
+        if session.tracking:
+            track = session.engine.update(frame)[0] # Update the tracker
+            if track["success"]:
+                return track["box"]
+    return None
+
+# Helper function to draw the tracked object box
+def draw_box(frame, box):
+    if box is not None:
+        p1 = (box[0], box[1])
+        p2 = (box[0] + box[2], box[1] + box[3])
+        cv2.rectangle(frame, p1, p2, (0, 0, 255), 3) # Draw rectangle around the tracked object
+    return frame
 
 # Helper function to track object  
 def track_object(frame):  
-    global tracker, tracking
-    if tracking:
-        success, point = tracker.update(frame) # Update the tracker
-        if success:
-            p1 = (int(point[0]), int(point[1]))
-            p2 = (int(point[0] + point[2]), int(point[1] + point[3]))
-            cv2.rectangle(frame, p1, p2, (0, 0, 255), 3) # Draw rectangle around the tracked object
-    
-    return frame
+    return draw_box(frame, update_tracker(frame))
 
 # API route to handle object tracking
-@app.route("/object_tracking", methods=["POST"])
+@bp.route("/object_tracking", methods=["POST"])
 
 def object_tracking():
     try:
-        # Decode the frame sent from the frontend
-        data = request.json
-        frame_str = data["frame"]
-        frame_data = base64.b64decode(frame_str)
-        nparr = np.frombuffer(frame_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Decode the frame sent from the frontend (JSON/base64 or binary)
+        frame_request = decode_request(request)
+        data = frame_request.meta
+        frame = frame_request.frame
 
         # Get the mode (default to "track")
         mode = data.get("mode", "track") 
@@ -45,20 +80,44 @@ def object_tracking():
         if mode == "initialize":
             roi = data["roi"] # ROI will be provided by the frontend
             roi_tuple = tuple(map(int, roi)) # Convert ROI to tuple (x, y, w, h)
-            initialize_tracker(frame, roi_tuple)
-            return jsonify({"status": "tracking initialized"})   
+            tracker = data.get("tracker", DEFAULT_TRACKER)
+            if not is_tracker(tracker):
+                return jsonify({"error": f"Unknown tracker: {tracker}"}), 400
+
+            # Every initialize starts a new session, so several clients can track at once
+            # (a client re-selecting sends its previous session id, which is dropped right away)
+            if "session_id" in data:
+                sessions.close(data["session_id"])
+            session_id, session = sessions.create()
+            initialize_tracker(frame, roi_tuple, session, tracker)
+            if "session_id" not in data:
+                initialize_default(frame, roi_tuple, tracker)
+            return jsonify({"status": "tracking initialized", "session_id": session_id,
+                            "tracker": session.engine.kind})
         
         elif mode == "track":
-            processed_frame = track_object(frame)   
+            session = sessions.resolve(data, default_session)
+            box = update_tracker(frame, session)
+            results = {"box": box, "success": box is not None,
+                       "tracks": [{"id": 0, "box": box, "label": "Object"}] if box is not None else [],
+                       "tracker": session.engine.kind if session.engine else None}
+            if frame_request.annotations_only:
+                return make_response(frame_request, results)
 
-            # Encode the frame to send to the frontend
-            _, buffer = cv2.imencode(".jpg", processed_frame)
-            frame_str = base64.b64encode(buffer).decode("utf-8")
+            processed_frame = draw_box(frame, box)
 
-            return jsonify({"frame": frame_str})
+            # Encode the frame to send to the frontend
+            return make_response(frame_request, results, processed_frame)
+    except UnknownSession:
+        return jsonify({"error": UNKNOWN_SESSION_ERROR}), 404
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
            
+# Standalone server for this pipeline only
+app = Flask(__name__)
+app.register_blueprint(bp)
+app.register_blueprint(status_bp)
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5003)
\ No newline at end of file
+    serving.main(app, 5003, "Single object tracking backend")
\ No newline at end of file
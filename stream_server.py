@@ -0,0 +1,147 @@
+import io
+import json
+import socket
+import socketserver
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from frame_transport import META_HEADER, recv_message, send_message
+
+# Default port of the stream server started next to the inference server
+DEFAULT_STREAM_PORT = 5006
+
+# Frames a connection may have waiting or in progress; beyond that a frame is answered "busy" right
+# away (like the HTTP backpressure) instead of queueing without bound
+MAX_PENDING = 16
+
+# Helper function to build the WSGI environ of a streamed frame: the binary HTTP POST it stands for
+# remote_addr is the peer's address, so the routes apply the same checks as for HTTP clients
+def frame_environ(route, meta, body, server_address, remote_addr):
+    path, _, query = route.partition("?")
+    return {
+        "REQUEST_METHOD": "POST",
+        "SCRIPT_NAME": "",
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "SERVER_NAME": server_address[0],
+        "SERVER_PORT": str(server_address[1]),
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": remote_addr,
+        "CONTENT_TYPE": "application/octet-stream",
+        "CONTENT_LENGTH": str(len(body)),
+        "HTTP_" + META_HEADER.upper().replace("-", "_"): json.dumps(meta),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+
+# Helper function to run one streamed frame through the app's WSGI application, exactly as a binary
+# HTTP POST would be (same routes, sessions, metrics and backpressure), returns (status, results, JPEG body)
+def dispatch(app, route, meta, body, server_address, remote_addr):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"], started["headers"] = int(status.split(" ", 1)[0]), dict(headers)
+
+    chunks = app.wsgi_app(frame_environ(route, meta, body, server_address, remote_addr), start_response)
+    try:
+        data = b"".join(chunks)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    headers = started["headers"]
+    if headers.get("Content-Type", "").startswith("image/jpeg"):
+        return started["status"], json.loads(headers.get(META_HEADER) or "{}"), data
+    try:
+        results = json.loads(data) if data else {}
+    except ValueError:
+        results = {}
+    return started["status"], results if isinstance(results, dict) else {}, b""
+
+# One client connection: frames are read as fast as they arrive and processed on the server's pool,
+# results are written back as soon as they are ready (possibly out of order, the seq tells them apart)
+# Frames with the same "key" (e.g. a tracking session id) are processed one at a time, in order
+class StreamHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.write_lock = threading.Lock()
+        self.ordered = {} # Key -> frames waiting for the previous frame of that key
+        self.ordered_lock = threading.Lock()
+        self.pending = 0 # Frames received and not answered yet
+        self.pending_lock = threading.Lock()
+
+    def reply(self, header, body=b""):
+        try:
+            with self.write_lock:
+                send_message(self.request, header, body)
+        except OSError:
+            pass # The client went away, its remaining results are dropped
+
+    def run(self, header, body):
+        try:
+            status, results, frame = dispatch(self.server.app, header["route"], header.get("meta", {}), body,
+                                             self.server.server_address, self.client_address[0])
+        except Exception as e:
+            status, results, frame = 500, {"error": str(e)}, b""
+        with self.pending_lock:
+            self.pending -= 1
+        self.reply({"seq": header["seq"], "status": status, "results": results}, frame)
+
+    def drain(self, key):
+        while True:
+            with self.ordered_lock:
+                waiting = self.ordered[key]
+                if not waiting:
+                    del self.ordered[key]
+                    return
+                header, body = waiting.popleft()
+            self.run(header, body)
+
+    def handle(self):
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (OSError, ValueError):
+                break
+            if message is None:
+                break
+            header, body = message
+            with self.pending_lock:
+                busy = self.pending >= self.server.max_pending
+                if not busy:
+                    self.pending += 1
+            if busy:
+                self.reply({"seq": header.get("seq"), "status": 503, "results": {"error": "busy", "busy": True}})
+                continue
+            key = header.get("key")
+            if key is None:
+                self.server.pool.submit(self.run, header, body)
+                continue
+            with self.ordered_lock:
+                if key in self.ordered:
+                    self.ordered[key].append((header, body))
+                else:
+                    self.ordered[key] = deque([(header, body)])
+                    self.server.pool.submit(self.drain, key)
+
+class StreamServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, app, host="0.0.0.0", port=DEFAULT_STREAM_PORT, workers=4, max_pending=MAX_PENDING):
+        super().__init__((host, port), StreamHandler)
+        self.app = app
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+# Helper function to serve an app's routes over the streaming protocol in a background thread
+def start_stream_server(app, host="0.0.0.0", port=DEFAULT_STREAM_PORT, workers=4):
+    server = StreamServer(app, host, port, workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Streaming frames on {host}:{port}")
+    return server
@@ -0,0 +1,43 @@
+import base64
+import cv2
+import pytest
+from benchmark import synthetic_clip
+import multi_object_tracking
+import single_object_tracking
+
+# Legacy JSON clients (no session id anywhere) initialize, then track what they initialized
+
+def post(client, frame, **meta):
+    ok, buffer = cv2.imencode(".jpg", frame)
+    response = client.post("/object_tracking", json=dict(meta, frame=base64.b64encode(buffer).decode("utf-8")))
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+@pytest.fixture
+def clip():
+    return synthetic_clip(320, 240, 6, objects=2)
+
+def test_single_sessionless_initialize_then_track(clip):
+    frames, truth = clip
+    client = single_object_tracking.app.test_client()
+    assert "session_id" in post(client, frames[0], mode="initialize", roi=truth[0][0])
+    for frame in frames[1:]:
+        result = post(client, frame, mode="track")
+        assert result["box"] is not None
+        assert result["tracks"][0]["id"] == 0
+
+def test_multi_sessionless_initialize_then_track(clip):
+    frames, truth = clip
+    client = multi_object_tracking.app.test_client()
+    assert "session_id" in post(client, frames[0], mode="initialize", rois=truth[0])
+    for frame in frames[1:]:
+        result = post(client, frame, mode="track")
+        assert len(result["boxes"]) == 2
+
+def test_session_clients_keep_their_own_trackers(clip):
+    frames, truth = clip
+    client = multi_object_tracking.app.test_client()
+    session_id = post(client, frames[0], mode="initialize", rois=truth[0][:1])["session_id"]
+    post(client, frames[0], mode="initialize", rois=truth[0]) # A legacy client initializes afterwards
+    assert len(post(client, frames[1], mode="track", session_id=session_id)["boxes"]) == 1
+    assert len(post(client, frames[1], mode="track")["boxes"]) == 2
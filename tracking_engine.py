@@ -0,0 +1,185 @@
+import colorsys
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import metrics
+
+# Consecutive frames a track may be lost before it is dropped
+MAX_LOST_FRAMES = 10
+
+# Tracker algorithms selectable per session ("tracker" in the initialize request)
+# CSRT is the most accurate and the slowest, KCF is several times faster, MOSSE is the cheapest
+TRACKERS = {
+    "csrt": lambda: cv2.TrackerCSRT_create(),
+    "kcf": lambda: cv2.TrackerKCF_create(),
+    "mil": lambda: cv2.TrackerMIL_create(),
+    "mosse": lambda: cv2.legacy.TrackerMOSSE_create(),
+    "medianflow": lambda: cv2.legacy.TrackerMedianFlow_create(),
+    "boosting": lambda: cv2.legacy.TrackerBoosting_create(),
+    "tld": lambda: cv2.legacy.TrackerTLD_create(),
+}
+DEFAULT_TRACKER = "csrt"
+
+# "adaptive": start with the most accurate tracker, switch to a cheaper one when the update of a
+# frame stays over budget, and back when the last measured cost of the more accurate one fits again
+# That cost is only measured while it runs, so after PROBE_INTERVAL seconds it is tried again anyway
+# (a trial that goes over budget doubles the interval, up to MAX_PROBE_INTERVAL)
+ADAPTIVE = "adaptive"
+ADAPTIVE_TRACKERS = ("csrt", "kcf", "mosse")
+UPDATE_BUDGET_MS = 30
+ADAPT_FRAMES = 15 # Consecutive frames over budget (or with headroom) before switching
+PROBE_INTERVAL = 10.0
+MAX_PROBE_INTERVAL = 80.0
+
+# Colors of the first tracks (BGR), as before: red, yellow, blue; later tracks get generated colors
+TRACK_COLORS = [(0, 0, 255), (0, 255, 255), (255, 0, 0)]
+
+# Helper function to get a distinct, stable color for any track id
+def track_color(track_id):
+    if track_id < len(TRACK_COLORS):
+        return TRACK_COLORS[track_id]
+    hue = (track_id * 0.618033988749895) % 1.0 # Golden ratio steps keep neighbouring ids apart
+    r, g, b = colorsys.hsv_to_rgb(hue, 0.85, 1.0)
+    return (int(b * 255), int(g * 255), int(r * 255))
+
+# Threads updating the trackers of every session (OpenCV releases the GIL during update)
+# Created on first use, under a lock since sessions are updated from several request threads
+_pool = None
+_pool_lock = threading.Lock()
+
+def pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="tracker")
+    return _pool
+
+def is_tracker(kind):
+    return kind in TRACKERS or kind == ADAPTIVE
+
+def create_tracker(kind=DEFAULT_TRACKER):
+    if kind not in TRACKERS:
+        raise ValueError(f"Unknown tracker: {kind} (one of {', '.join(list(TRACKERS) + [ADAPTIVE])})")
+    return TRACKERS[kind]()
+
+# One tracked object: its own tracker, a stable id and its latest box
+class Track:
+    def __init__(self, track_id, tracker, box, label):
+        self.id = track_id
+        self.tracker = tracker
+        self.box = box
+        self.label = label
+        self.success = True
+        self.lost = 0 # Consecutive frames without a successful update
+
+    def update(self, frame):
+        success, box = self.tracker.update(frame)
+        self.success = bool(success)
+        if self.success:
+            self.box = [int(v) for v in box]
+            self.lost = 0
+        else:
+            self.lost += 1
+
+    def result(self):
+        return {"id": self.id, "box": self.box, "label": self.label, "success": self.success}
+
+# Tracks any number of objects with one tracker each, updated in parallel on the shared pool,
+# so the frame time stays close to the time of the slowest tracker instead of the sum of all
+# Ids are never reused; tracks lost for more than max_lost frames are dropped (never with None)
+class TrackingEngine:
+    def __init__(self, max_lost=MAX_LOST_FRAMES, tracker=DEFAULT_TRACKER, budget_ms=UPDATE_BUDGET_MS,
+                 create=create_tracker):
+        self.max_lost = max_lost
+        self.adaptive = tracker == ADAPTIVE
+        self.kind = ADAPTIVE_TRACKERS[0] if self.adaptive else tracker
+        self.budget = budget_ms / 1000
+        self.create = create
+        self.create(self.kind) # Fail on initialize for an unknown tracker, not on the first object
+        self.tracks = []
+        self.ids = itertools.count()
+        self.over = self.under = 0 # Consecutive frames over budget / with headroom
+        # Tracker kind -> smoothed update time of a whole frame (seconds, all tracks updated in parallel,
+        # the same quantity the budget applies to) and when it was last measured
+        self.cost = {}
+        self.measured = {}
+        self.probe_interval = PROBE_INTERVAL
+        self.trial = False # The current tracker was stepped up to and hasn't held for long yet
+        self.frames = 0 # Frames since the last switch
+
+    def add(self, frame, roi, label=None):
+        box = [int(v) for v in roi]
+        tracker = self.create(self.kind)
+        tracker.init(frame, tuple(box))
+        track_id = next(self.ids)
+        track = Track(track_id, tracker, box, label or f"Object {track_id + 1}")
+        self.tracks.append(track)
+        return track
+
+    # Update every track on the frame, returns the results of the tracks still alive
+    def update(self, frame):
+        start = time.perf_counter()
+        if len(self.tracks) > 1:
+            list(pool().map(lambda track: track.update(frame), self.tracks))
+        else:
+            for track in self.tracks:
+                track.update(frame)
+        seconds = time.perf_counter() - start
+        metrics.observe("tracker_update", seconds)
+        metrics.observe(f"tracker_update:{self.kind}", seconds)
+
+        if self.adaptive and self.tracks:
+            self.adapt(frame, seconds)
+        if self.max_lost is not None:
+            self.tracks = [track for track in self.tracks if track.lost <= self.max_lost]
+        return [track.result() for track in self.tracks]
+
+    # Adaptive mode: move one step along ADAPTIVE_TRACKERS after ADAPT_FRAMES frames over budget
+    # (cheaper), or with headroom while the more accurate tracker is expected to fit (more accurate)
+    def adapt(self, frame, seconds):
+        now = time.monotonic()
+        cost = self.cost.get(self.kind)
+        self.cost[self.kind] = seconds if cost is None else 0.9 * cost + 0.1 * seconds
+        self.measured[self.kind] = now
+        self.frames += 1
+        if self.trial and self.frames >= 4 * ADAPT_FRAMES:
+            self.trial, self.probe_interval = False, PROBE_INTERVAL # The step up held
+
+        level = ADAPTIVE_TRACKERS.index(self.kind)
+        if seconds > self.budget:
+            self.over, self.under = self.over + 1, 0
+        elif level > 0 and seconds < 0.8 * self.budget and self.fits(ADAPTIVE_TRACKERS[level - 1], now):
+            self.over, self.under = 0, self.under + 1
+        else:
+            self.over = self.under = 0
+
+        if self.over >= ADAPT_FRAMES and level < len(ADAPTIVE_TRACKERS) - 1:
+            if self.trial: # The load that made it step down is still there: wait longer next time
+                self.probe_interval = min(self.probe_interval * 2, MAX_PROBE_INTERVAL)
+            self.trial = False
+            self.switch(frame, ADAPTIVE_TRACKERS[level + 1])
+        elif self.under >= ADAPT_FRAMES:
+            self.trial = True
+            self.switch(frame, ADAPTIVE_TRACKERS[level - 1])
+
+    # A tracker is expected to fit the budget when its last measured frame time did, or when that
+    # measurement is older than the probe interval (it may have been taken during a load spike)
+    def fits(self, kind, now):
+        cost = self.cost.get(kind)
+        return cost is None or cost < 0.8 * self.budget or now - self.measured[kind] > self.probe_interval
+
+    # Restart every track with another tracker kind from its last box (ids and labels are kept)
+    def switch(self, frame, kind):
+        for track in self.tracks:
+            track.tracker = self.create(kind)
+            track.tracker.init(frame, tuple(track.box))
+        print(f"Tracker switched from {self.kind} to {kind}")
+        self.kind = kind
+        self.over = self.under = self.frames = 0
+
+    def results(self):
+        return [track.result() for track in self.tracks]